@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import logging
+import multiprocessing
 import sys
 
 import juridoc
@@ -7,6 +8,7 @@ import juridoc
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
+	multiprocessing.freeze_support()
 	logging.basicConfig(
         level=logging.DEBUG,
         format="[%(levelname)s] %(name)s: %(message)s",
@@ -1,10 +1,19 @@
 from .config import Config
 from .db import Db
+from .index import Index
 from .note import Note
-from .repo import Repo
 from .source import Source
 from .sources_index import SourcesIndex
+from .thumbnails import Thumbnails
 
-from .gui.__main__ import run
+def __getattr__(name):
+    # Qt is only loaded along with the GUI
+    if name == 'Repo':
+        from .repo import Repo
+        return Repo
+    elif name == 'run':
+        from .gui.__main__ import run
+        return run
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-__all__ = ['Repo', 'Db', 'SourcesIndex', 'Note', 'Source', 'run']
\ No newline at end of file
+__all__ = ['Repo', 'Db', 'Index', 'SourcesIndex', 'Note', 'Source', 'Thumbnails', 'run']
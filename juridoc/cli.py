@@ -0,0 +1,170 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+from .config import Config
+from .db import Db
+from .index import Index
+from .split import parse_ranges, read_manifest, split_many
+
+logger = logging.getLogger(__name__)
+
+RETURN_BADARG=1
+
+def _open_project(args):
+    """
+    Open the project DB, storing directories given on the command line in its
+    config. Returns an Index configured from the project.
+    """
+    Db().init(args.project)
+
+    for key in ('sources_dir', 'notes_dir', 'hash_workers', 'analysis_workers', 'export_workers', 'export_links'):
+        value = getattr(args, key, None)
+        if value is not None:
+            # Directories are stored absolute, the project being opened from
+            # anywhere later on
+            if key in ('sources_dir', 'notes_dir'):
+                value = os.path.abspath(value)
+            Config().set(key, str(value))
+
+    index = Index()
+    index.set_hash_workers(Config().get('hash_workers'))
+    index.set_analysis_workers(Config().get('analysis_workers'))
+    index.set_export_workers(Config().get('export_workers'))
+    index.set_export_links(Config().get('export_links'))
+
+    return index
+
+# Progress lines are overwritten by the next one, or the next log
+def _print_sources_progress(seen, hashed, rate):
+    print(f"Sources: {seen} files, {hashed} hashed, {rate / (1024 * 1024):.1f} MB/s", end='\r', file=sys.stderr)
+
+def _print_notes_progress(done, total):
+    print(f"Notes: {done}/{total}", end='\r', file=sys.stderr)
+
+def index(args):
+    project = _open_project(args)
+
+    sources_dir = Config().get('sources_dir')
+    notes_dir = Config().get('notes_dir')
+    if not sources_dir and not notes_dir:
+        logger.error("No sources nor notes directory set for this project")
+        Db().close()
+        return RETURN_BADARG
+
+    if not args.quiet and sys.stderr.isatty():
+        project.sources_progress.connect(_print_sources_progress)
+        project.notes_progress.connect(_print_notes_progress)
+
+    start = time.monotonic()
+    # Sources first, for notes to resolve their references
+    if sources_dir:
+        project.set_sources_dir(sources_dir)
+    if notes_dir:
+        project.set_notes_dir(notes_dir)
+
+    Db().close()
+    logger.info(f"Indexed {len(project.sources)} sources in {time.monotonic() - start:.1f}s")
+    return 0
+
+def export(args):
+    project = _open_project(args)
+    # Sources are stored under the resolved sources dir, see set_sources_dir()
+    sources_dir = Config().get('sources_dir')
+    project.sources_dir = os.path.realpath(sources_dir) if sources_dir else None
+    project.notes_dir = Config().get('notes_dir')
+    project.set_output_dir(args.output_dir)
+
+    # Everything by default
+    everything = not (args.index or args.sources or args.notes)
+    if everything or args.index:
+        project.export_index(args.index_format)
+    if everything or args.sources:
+        project.export_sources()
+    if everything or args.notes:
+        project.export_notes()
+
+    Db().close()
+    return 0
+
+def split(args):
+    try:
+        if args.manifest:
+            jobs = read_manifest(args.manifest)
+        elif args.filename and args.ranges:
+            jobs = [(args.filename, parse_ranges(args.ranges))]
+        else:
+            logger.error("Expected a PDF file and page ranges, or --manifest")
+            return RETURN_BADARG
+        results = split_many(jobs, args.output_dir, args.workers)
+    except (OSError, ValueError) as e:
+        logger.error(f"Invalid split request: {e}")
+        return RETURN_BADARG
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.monotonic()
+    outputs = 0
+    failed = 0
+    for filename, paths, seconds, errors in results:
+        outputs += len(paths)
+        if errors:
+            failed += 1
+            for error in errors:
+                logger.error(f"ERROR splitting {filename}: {error}")
+        logger.info(f"Split {filename}: {len(paths)} files in {seconds:.2f}s")
+
+    logger.info(f"Wrote {outputs} files from {len(set(filename for filename, _ in jobs))} PDFs in {time.monotonic() - start:.1f}s")
+    return 1 if failed else 0
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='juridoc', description="Index and export juridoc projects, without GUI")
+    parser.add_argument('-v', '--verbose', action='store_true', help="debug logs")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = commands.add_parser('index', help="index sources and notes into a project")
+    index_parser.add_argument('project', help="project file (.jd), created if missing")
+    index_parser.add_argument('--sources', dest='sources_dir', help="sources directory, stored in the project")
+    index_parser.add_argument('--notes', dest='notes_dir', help="notes directory, stored in the project")
+    index_parser.add_argument('--hash-workers', type=int, help="threads hashing sources")
+    index_parser.add_argument('--analysis-workers', type=int, help="processes parsing notes")
+    index_parser.add_argument('-q', '--quiet', action='store_true', help="no progress on a terminal")
+    index_parser.set_defaults(func=index)
+
+    export_parser = commands.add_parser('export', help="export a project")
+    export_parser.add_argument('project', help="project file (.jd)")
+    export_parser.add_argument('output_dir', help="output directory")
+    export_parser.add_argument('--index', action='store_true', help="export the sources index")
+    export_parser.add_argument('--index-format', choices=['ods', 'xlsx', 'csv', 'jsonl'], help="sources index format, ods by default")
+    export_parser.add_argument('--sources', action='store_true', help="export sources")
+    export_parser.add_argument('--notes', action='store_true', help="export notes")
+    export_parser.add_argument('-j', '--workers', dest='export_workers', type=int, help="threads copying files, stored in the project")
+    export_parser.add_argument('--link', dest='export_links', action='store_true', default=None, help="hard link files instead of copying them where possible, stored in the project")
+    export_parser.set_defaults(func=export)
+
+    split_parser = commands.add_parser('split', help="split PDFs into page ranges")
+    split_parser.add_argument('filename', nargs='?', help="PDF file")
+    split_parser.add_argument('ranges', nargs='?', help="page ranges, e.g. 2-3,5,7-9")
+    split_parser.add_argument('-m', '--manifest', help="file of '<pdf file> <ranges>' lines, instead of a single PDF")
+    split_parser.add_argument('-o', '--output-dir', help="output directory, next to each PDF by default")
+    split_parser.add_argument('-j', '--workers', type=int, help="processes splitting PDFs")
+    split_parser.set_defaults(func=split)
+
+    return parser
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="[%(levelname)s] %(name)s: %(message)s",
+    )
+
+    if getattr(args, 'project', None) and args.func is not index and not os.path.exists(args.project):
+        logger.error(f"Invalid DB path: {args.project}")
+        return RETURN_BADARG
+
+    return args.func(args)
@@ -1,16 +1,15 @@
 import logging
 
-from PySide6.QtCore import QObject, Signal
-
 from .db import Db
+from .events import Event
 
 logger = logging.getLogger(__name__)
 
-class Config(QObject):
+class Config():
     _instance = None
     _initialized = False
 
-    config_changed = Signal(str, str)
+    config_changed = Event()
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
@@ -19,7 +18,6 @@ class Config(QObject):
 
     def __init__(self):
         if not self._initialized:
-            super().__init__()
             self._initialized = True
 
     def load(self):
@@ -41,12 +39,11 @@ class Config(QObject):
         return value
 
     def set(self, key: str, value: str) -> None:
-        with Db().get_conn() as conn:
-            conn.execute('''
+        Db().write(lambda conn: conn.execute('''
                     INSERT INTO config (key, value)
                     VALUES (?, ?)
                     ON CONFLICT(key) DO UPDATE SET
                         value=excluded.value
-                  ''', (key, value))
-            
+                  ''', (key, value))).result()
+
         self.config_changed.emit(key, value)
\ No newline at end of file
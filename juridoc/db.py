@@ -1,21 +1,49 @@
+import itertools
 import logging
+import os
+import queue
 import sqlite3
 import sys
+import threading
+import time
+from concurrent.futures import Future
 
 logger = logging.getLogger(__name__)
 
+# Names of in-memory projects, shared by their connections
+_memory_names = itertools.count(1)
+
 class Db:
+    """
+    Project DB. Each thread reads through its own connection (get_conn()),
+    all writes go through a single writer thread (write()). File projects are
+    in WAL mode, so that readers are not blocked by the writer; in-memory
+    projects are shared between connections by URI.
+    """
     _instance = None
 
+    # Restarts of the copy of an in-memory project by writes run during its
+    # save, before writes wait for the end of the save
+    save_restarts = 3
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(Db, cls).__new__(cls)
             cls._instance.conn = None
+            cls._instance.path = None
+            cls._instance.uri = None
+            cls._instance.local = threading.local()
+            cls._instance.conns = []
+            cls._instance.conns_lock = threading.Lock()
+            cls._instance.generation = 0
+            cls._instance.writes = None
+            cls._instance.writer = None
         return cls._instance
         
     def init(self, path):
         self.open(path)
 
+        # Schema updates run before any write is queued
         with self.conn as conn:
             # Config table
             self._safe_create("table 'config'", '''
@@ -32,10 +60,13 @@ class Db:
                     hash TEXT NOT NULL UNIQUE,
                     sources_dir TEXT,
                     path TEXT UNIQUE,
-                    image BLOB
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    inode INTEGER,
+                    device INTEGER
                 )
             ''', conn)
-            
+
             self._safe_create("index 'source <> hash'", '''
                 CREATE INDEX IF NOT EXISTS idx_source_hash ON source(hash)
             ''', conn)
@@ -45,7 +76,12 @@ class Db:
                 CREATE TABLE IF NOT EXISTS notes (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     notes_dir TEXT,
-                    path TEXT UNIQUE
+                    path TEXT UNIQUE,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    inode INTEGER,
+                    device INTEGER,
+                    refs TEXT
                 )
             ''', conn)
 
@@ -61,6 +97,169 @@ class Db:
                 )
             ''', conn)
 
+            self._migrate(conn)
+
+    def _migrate(self, conn):
+        """
+        Bring projects created with an older schema up to date.
+        PRAGMA user_version holds the number of migrations applied.
+        """
+        migrations = [
+            ("source stat fingerprint", self._migrate_source_stat),
+            ("source location index", self._migrate_source_location),
+            ("thumbnail store", self._migrate_thumbnail),
+            ("notes fingerprint", self._migrate_notes_stat),
+            ("xref note index", self._migrate_xref_note),
+            ("source numbers", self._migrate_source_idx),
+            ("rendered notes", self._migrate_note_export),
+            ("source path unique per sources dir", self._migrate_source_location_unique),
+            ("source number sequence", self._migrate_source_seq),
+        ]
+
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for version, (name, migration) in enumerate(migrations[version:], start=version + 1):
+            logger.info(f"Migrate schema to version {version}: {name}")
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+
+    def _migrate_source_stat(self, conn):
+        for column in ('size', 'mtime_ns', 'inode', 'device'):
+            self._safe_add_column(f"column 'source.{column}'", f'''
+                ALTER TABLE source ADD COLUMN {column} INTEGER
+            ''', conn)
+
+    def _migrate_source_location(self, conn):
+        # Prefix lookups: sources_dir = ? AND path >= 'dir/' AND path < 'dir0'
+        self._safe_create("index 'source <> location'", '''
+            CREATE INDEX IF NOT EXISTS idx_source_location ON source(sources_dir, path)
+        ''', conn)
+
+    def _migrate_thumbnail(self, conn):
+        # Thumbnails are keyed by content and size, out of the source rows
+        self._safe_create("table 'thumbnail'", '''
+            CREATE TABLE IF NOT EXISTS thumbnail (
+                hash TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                image BLOB,
+                PRIMARY KEY (hash, width, height)
+            )
+        ''', conn)
+
+        columns = [row['name'] for row in conn.execute('PRAGMA table_info(source)')]
+        if 'image' in columns:
+            # Embedded thumbnails were rendered at the sources view label size
+            conn.execute('''
+                INSERT OR IGNORE INTO thumbnail (hash, width, height, image)
+                SELECT hash, 120, 160, image FROM source WHERE image IS NOT NULL AND length(image) > 0
+            ''')
+            conn.execute('ALTER TABLE source DROP COLUMN image')
+            logger.info("Moved source thumbnails to table 'thumbnail'")
+
+    def _migrate_notes_stat(self, conn):
+        # Stat fingerprint and all source references found in the note
+        for column, type in (('size', 'INTEGER'), ('mtime_ns', 'INTEGER'), ('inode', 'INTEGER'), ('device', 'INTEGER'), ('refs', 'TEXT')):
+            self._safe_add_column(f"column 'notes.{column}'", f'''
+                ALTER TABLE notes ADD COLUMN {column} {type}
+            ''', conn)
+
+    def _migrate_xref_note(self, conn):
+        # Replacing the xrefs of a note
+        self._safe_create("index 'xref <> note'", '''
+            CREATE INDEX IF NOT EXISTS idx_xref_note ON xref(note_id)
+        ''', conn)
+
+    def _migrate_source_idx(self, conn):
+        # Sources are cited by number in exported notes: a source keeps its
+        # number through renames and content changes, new sources are numbered
+        # after the last one
+        self._safe_add_column("column 'source.idx'", '''
+            ALTER TABLE source ADD COLUMN idx INTEGER
+        ''', conn)
+        self._safe_create("index 'source <> idx'", '''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_source_idx ON source(idx)
+        ''', conn)
+        self._safe_create("trigger 'source idx'", '''
+            CREATE TRIGGER IF NOT EXISTS source_idx AFTER INSERT ON source
+            WHEN NEW.idx IS NULL
+            BEGIN
+                UPDATE source SET idx = (SELECT COALESCE(MAX(idx), 0) + 1 FROM source) WHERE id = NEW.id;
+            END
+        ''', conn)
+
+        # Existing sources are numbered in path order
+        ids = [row['id'] for row in conn.execute('SELECT id FROM source WHERE idx IS NULL ORDER BY path, id')]
+        start = conn.execute('SELECT COALESCE(MAX(idx), 0) FROM source').fetchone()[0]
+        conn.executemany('UPDATE source SET idx = ? WHERE id = ?', [(start + n, id) for n, id in enumerate(ids, start=1)])
+        if ids:
+            logger.info(f"Numbered {len(ids)} sources")
+
+    def _migrate_note_export(self, conn):
+        # Source numbers each rendered note output was rendered with, keyed
+        # by output path
+        self._safe_create("table 'note_export'", '''
+            CREATE TABLE IF NOT EXISTS note_export (
+                path TEXT PRIMARY KEY,
+                deps TEXT
+            )
+        ''', conn)
+
+    def _migrate_source_location_unique(self, conn):
+        # A path is unique within its sources dir only: the same relative path
+        # may be known from several sources dirs. SQLite can't drop a column
+        # constraint, the table is rebuilt.
+        schema = [row['sql'] for row in conn.execute('''
+            SELECT sql FROM sqlite_master
+            WHERE tbl_name = 'source' AND type IN ('index', 'trigger') AND sql IS NOT NULL AND name != 'idx_source_location'
+        ''')]
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'source'").fetchone()
+        columns = 'id, hash, sources_dir, path, size, mtime_ns, inode, device, idx'
+
+        conn.execute('''
+            CREATE TABLE source_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hash TEXT NOT NULL UNIQUE,
+                sources_dir TEXT,
+                path TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                device INTEGER,
+                idx INTEGER,
+                UNIQUE(sources_dir, path)
+            )
+        ''')
+        conn.execute(f'INSERT INTO source_new ({columns}) SELECT {columns} FROM source')
+        conn.execute('DROP TABLE source')
+        conn.execute('ALTER TABLE source_new RENAME TO source')
+        for sql in schema:
+            conn.execute(sql)
+        if seq is not None:
+            conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'source'", (seq['seq'],))
+        logger.info("Rebuilt table 'source'")
+
+    def _migrate_source_seq(self, conn):
+        # Numbers of removed sources are never given again: the last number
+        # given is kept in a one-row table, MAX(idx) would reuse the numbers
+        # of the last sources removed
+        self._safe_create("table 'source_seq'", '''
+            CREATE TABLE IF NOT EXISTS source_seq (
+                value INTEGER NOT NULL
+            )
+        ''', conn)
+        if conn.execute('SELECT COUNT(*) FROM source_seq').fetchone()[0] == 0:
+            conn.execute('INSERT INTO source_seq (value) SELECT COALESCE(MAX(idx), 0) FROM source')
+
+        conn.execute('DROP TRIGGER IF EXISTS source_idx')
+        self._safe_create("trigger 'source idx'", '''
+            CREATE TRIGGER source_idx AFTER INSERT ON source
+            WHEN NEW.idx IS NULL
+            BEGIN
+                UPDATE source_seq SET value = value + 1;
+                UPDATE source SET idx = (SELECT value FROM source_seq) WHERE id = NEW.id;
+            END
+        ''', conn)
+
     def _safe_create(self, name, sql, conn):
         try:
             conn.execute(sql)
@@ -71,33 +270,248 @@ class Db:
             else:
                 raise
 
+    def _safe_add_column(self, name, sql, conn):
+        try:
+            conn.execute(sql)
+            logger.info(f"Added {name}")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" in str(e):
+                pass
+            else:
+                raise
+
     def open(self, path):
+        self._set_path(path)
+
+        self.writes = queue.Queue()
+        # Write taken from the queue during a save, to run after it
+        self.held = None
+        self.writer = threading.Thread(target=self._write_loop, args=(self.writes,), name="db-writer", daemon=True)
+        self.writer.start()
+
+    def _set_path(self, path):
+        """
+        Point new connections to path. Threads reconnect on their next
+        get_conn().
+        """
         if path == ':memory:':
             db = "(RAM)"
+            self.uri = f"file:juridoc-{next(_memory_names)}?mode=memory&cache=shared"
         else:
             db = path
+            self.uri = None
+        self.path = path
+
+        logger.debug(f"Opening DB: {db}")
+        self.generation += 1
+
+        # Schema updates go through it; it also keeps in-memory projects alive
+        if self.conn is not None:
+            with self.conns_lock:
+                if self.conn in self.conns:
+                    self.conns.remove(self.conn)
+            self.conn.close()
+        self.conn = self._connect()
+        if self.uri is None:
+            mode = self.conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+            logger.debug(f"Journal mode: {mode}")
+
+    def _connect(self):
+        if self.uri is not None:
+            conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+            # Shared cache locks tables: readers don't wait for the writer
+            conn.execute('PRAGMA read_uncommitted = 1')
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA busy_timeout = 5000')
+        conn.row_factory = sqlite3.Row
 
-        logger.debug(f"Opening DB: {db} (thread safety={sqlite3.threadsafety})")
-        self.conn = sqlite3.connect(path, check_same_thread=(sqlite3.threadsafety != 3))
-        self.conn.row_factory = sqlite3.Row
+        with self.conns_lock:
+            self.conns.append(conn)
+        return conn
 
     def get_conn(self):
-        return self.conn
-    
-    def save(self, path):
+        """
+        Returns the connection of the calling thread, opened on first use.
+        Writes should go through write().
+        """
+        if getattr(self.local, 'generation', None) != self.generation:
+            old = getattr(self.local, 'conn', None)
+            if old is not None:
+                # Connection to a former path, unused from now on. Closing the
+                # last one frees an in-memory project: done by the writer
+                with self.conns_lock:
+                    if old in self.conns:
+                        self.conns.remove(old)
+                if self.writer is not None and threading.current_thread() is not self.writer:
+                    self.write(lambda conn: old.close())
+                else:
+                    old.close()
+
+            self.local.conn = self._connect()
+            self.local.generation = self.generation
+        return self.local.conn
+
+    def release(self):
+        """
+        Close the connection of the calling thread, if any. Threads that read
+        the DB and end call it last, their connection would stay open until
+        close() otherwise.
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            return self
+        self.local.conn = None
+        self.local.generation = None
+
+        with self.conns_lock:
+            if conn not in self.conns:
+                # Already closed by close()
+                return self
+            self.conns.remove(conn)
+        conn.close()
+        return self
+
+    def write(self, fn, *args):
+        """
+        Queue fn(conn, *args) to the writer thread, run in a transaction.
+        Returns a Future of its result. Called from the writer thread (by a
+        write), fn runs at once within the current transaction.
+        """
+        if threading.current_thread() is self.writer:
+            future = Future()
+            future.set_result(fn(self.get_conn(), *args))
+            return future
+
+        future = Future()
+        self.writes.put((future, fn, args))
+        return future
+
+    def _write_loop(self, writes):
+        while True:
+            if self.held is not None:
+                item, self.held = self.held, None
+            else:
+                item = writes.get()
+            if item is None:
+                break
+            self._run_write(*item)
+
+    def _run_write(self, future, fn, args):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            # Reconnected after a save to another file
+            conn = self.get_conn()
+            with conn:
+                result = fn(conn, *args)
+        except Exception as e:
+            logger.error(f"ERROR writing to DB: {e}")
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    def _run_queued_writes(self):
+        """
+        Run the writes queued so far, from a save. A save or the end of the
+        writer stops at once: it is held to run after the current save.
+        """
+        while self.held is None:
+            try:
+                item = self.writes.get_nowait()
+            except queue.Empty:
+                return
+            if item is None or getattr(item[1], '__func__', None) is Db._save:
+                self.held = item
+                return
+            self._run_write(*item)
+
+    def flush(self):
+        """
+        Wait for queued writes to be committed.
+        """
+        if self.writer is not None:
+            self.write(lambda conn: None).result()
+        return self
+
+    def save(self, path, pages=256, progress=None):
+        """
+        Save the project to path, from the writer thread: returns a Future,
+        done once saved. The project then goes on in path.
+
+        Saving to the project file itself only checkpoints its WAL: pages
+        written since the last save. Otherwise, the DB is copied pages at a
+        time; progress(copied, total) is called after each step, from the
+        writer thread. Writes queued meanwhile run between steps, through the
+        connection being copied: SQLite copies their pages too, so that
+        threads waiting for a write only wait for a step.
+        """
         logger.debug(f"Set DB path: {path}")
+        return self.write(self._save, path, pages, progress)
+
+    def _save(self, conn, path, pages, progress):
+        start = time.monotonic()
+
+        if self.uri is None and os.path.exists(path) and os.path.samefile(path, self.path):
+            _busy, log, checkpointed = conn.execute('PRAGMA wal_checkpoint(FULL)').fetchone()
+            if progress is not None:
+                progress(checkpointed, log)
+            logger.info(f"Saved DB: {checkpointed} pages in {time.monotonic() - start:.1f}s")
+            return path
+
+        copied = [0]
+        restarts = [0]
 
+        def step(_status, remaining, total):
+            if progress is not None:
+                progress(total - remaining, total)
+
+            # Writes restart the copy of in-memory projects: once it restarted
+            # too often, writes wait for the save
+            if total - remaining < copied[0]:
+                restarts[0] += 1
+            copied[0] = total - remaining
+            if remaining > 0 and (self.uri is None or restarts[0] < self.save_restarts):
+                self._run_queued_writes()
+
+        # The backup runs out of the writer transaction
+        conn.commit()
         file_conn = sqlite3.connect(path)
-        self.conn.backup(file_conn)
-        file_conn.close()
-        self.conn.close()
+        try:
+            # Backup steps lock the project: the file is synced after the
+            # last one, not during it
+            file_conn.execute('PRAGMA synchronous = OFF')
+            conn.backup(file_conn, pages=pages, progress=step)
+            total = file_conn.execute('PRAGMA page_count').fetchone()[0]
+            # Before any reader connects to it
+            file_conn.execute('PRAGMA journal_mode=WAL')
+        finally:
+            file_conn.close()
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        logger.info(f"Saved DB: {total} pages in {time.monotonic() - start:.1f}s")
 
-        self.open(path)
+        self._set_path(path)
+        return path
 
     def close(self):
         logger.debug("Closing DB")
-        self.conn.commit()
-        self.conn.close()
+        if self.writer is not None:
+            self.writes.put(None)
+            self.writer.join()
+            self.writer = None
+
+        with self.conns_lock:
+            conns, self.conns = self.conns, []
+        for conn in conns:
+            conn.commit()
+            conn.close()
+        self.generation += 1
+        self.conn = None
 
     def is_threadsafe(self):
         return sqlite3.threadsafety == 3
@@ -0,0 +1,36 @@
+class _BoundEvent():
+    def __init__(self):
+        self.callbacks = []
+
+    def connect(self, callback):
+        self.callbacks.append(callback)
+
+    def disconnect(self, callback=None):
+        if callback is None:
+            self.callbacks.clear()
+        else:
+            self.callbacks.remove(callback)
+
+    def emit(self, *args):
+        for callback in list(self.callbacks):
+            callback(*args)
+
+class Event():
+    """
+    Qt-free stand-in for Signal, declared as a class attribute: callbacks
+    connected to an instance's event are called synchronously on emit.
+
+    A Qt subclass may redeclare the same name as a Signal, keeping emit() calls
+    of the base class unchanged.
+    """
+    def __set_name__(self, owner, name):
+        self.attr = f"_event_{name}"
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+
+        bound = obj.__dict__.get(self.attr)
+        if bound is None:
+            bound = obj.__dict__[self.attr] = _BoundEvent()
+        return bound
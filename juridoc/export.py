@@ -0,0 +1,191 @@
+import errno
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# copy_file_range/sendfile failures meaning "not between these files"
+_FALLBACK_ERRNOS = set(getattr(errno, name) for name in ('EXDEV', 'ENOSYS', 'EINVAL', 'EOPNOTSUPP', 'ENOTSUP', 'EBADF') if hasattr(errno, name))
+
+def up_to_date(src_stat, dest):
+    """
+    Whether dest is an export of the file of src_stat: a link to it, or a copy
+    of the same size and mtime.
+    """
+    try:
+        st = os.stat(dest)
+    except OSError:
+        return False
+
+    if (st.st_ino, st.st_dev) == (src_stat.st_ino, src_stat.st_dev):
+        return True
+    return st.st_size == src_stat.st_size and st.st_mtime_ns == src_stat.st_mtime_ns
+
+def newer(dest, src):
+    """
+    Whether dest exists and is not older than src, as make sees it.
+    """
+    try:
+        return os.stat(dest).st_mtime_ns >= os.stat(src).st_mtime_ns
+    except OSError:
+        return False
+
+def _copy_range(size, copy):
+    copied = 0
+    while copied < size:
+        n = copy(size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied == size
+
+def copy_file(src, dest):
+    """
+    Copy src to dest without buffering through Python when the system allows:
+    reflink (copy-on-write clone), then copy_file_range, then sendfile, then
+    plain buffered copy. Returns the method used.
+    """
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        infd = fsrc.fileno()
+        outfd = fdst.fileno()
+
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(outfd, FICLONE, infd)
+                return 'reflink'
+            except OSError:
+                pass
+
+        size = os.fstat(infd).st_size
+
+        if hasattr(os, 'copy_file_range'):
+            try:
+                if _copy_range(size, lambda count: os.copy_file_range(infd, outfd, count)):
+                    return 'copy_file_range'
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+
+        if hasattr(os, 'sendfile'):
+            try:
+                offset = 0
+                def send(count):
+                    nonlocal offset
+                    n = os.sendfile(outfd, infd, offset, count)
+                    offset += n
+                    return n
+                if _copy_range(size, send):
+                    return 'sendfile'
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+        return 'copy'
+
+class Transfer():
+    """
+    Export files on a thread pool, skipping outputs already up to date.
+
+    Files are copied through copy_file(), or hard linked when link is set and
+    source and output share a filesystem: an edit of a linked output then
+    changes the source too. Outputs are written under a temporary name, and
+    renamed once complete with the source mtime.
+    """
+    def __init__(self, workers=None, link=False):
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.link = link
+
+        self.files = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.methods = {}
+        self.seconds = 0.0
+
+        self.lock = threading.Lock()
+
+    def run(self, pairs):
+        """
+        Export (src, dest) pairs. At most four times the pool size files are
+        in flight at any time.
+        """
+        start = time.monotonic()
+        window = self.workers * 4
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export") as executor:
+            pending = set()
+            for src, dest in pairs:
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(executor.submit(self._export_one, src, dest))
+            for future in wait(pending).done:
+                future.result()
+
+        self.seconds += time.monotonic() - start
+        return self
+
+    def _export_one(self, src, dest):
+        try:
+            src_stat = os.stat(src)
+            if up_to_date(src_stat, dest):
+                with self.lock:
+                    self.skipped += 1
+                return
+
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp = f"{dest}.part"
+            method = None
+            if self.link:
+                try:
+                    if os.path.lexists(tmp):
+                        os.remove(tmp)
+                    os.link(src, tmp)
+                    method = 'link'
+                except OSError:
+                    pass
+            if method is None:
+                method = copy_file(src, tmp)
+                shutil.copystat(src, tmp)
+            os.replace(tmp, dest)
+        except OSError as e:
+            logger.error(f"ERROR exporting {src}: {e}")
+            with self.lock:
+                self.failed += 1
+            return
+
+        with self.lock:
+            self.files += 1
+            self.bytes += src_stat.st_size
+            self.methods[method] = self.methods.get(method, 0) + 1
+
+    def summary(self):
+        rate = self.bytes / self.seconds / (1024 * 1024) if self.seconds > 0 else 0.0
+        methods = ', '.join(f"{method} {count}" for method, count in sorted(self.methods.items()))
+        summary = f"{self.files} files, {self.bytes / (1024 * 1024):.1f} MiB in {self.seconds:.1f}s ({rate:.1f} MiB/s)"
+        if methods:
+            summary += f" by {methods}"
+        summary += f", {self.skipped} up to date"
+        if self.failed:
+            summary += f", {self.failed} failed"
+        return summary
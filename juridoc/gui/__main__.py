@@ -6,7 +6,7 @@ from PySide6.QtWidgets import (
     QApplication, QMainWindow,
     QPushButton, QFileDialog, QTabWidget, QToolBar
 )
-from PySide6.QtCore import QSize, Qt
+from PySide6.QtCore import QObject, QSize, Qt, Signal
 
 from juridoc import Config
 from juridoc import Db
@@ -18,6 +18,13 @@ from .style_factory import StyleFactory
 
 logger = logging.getLogger(__name__)
 
+class _SaveRelay(QObject):
+    """
+    Brings project save progress from the DB writer thread to the GUI thread.
+    """
+    progress = Signal(int, int)
+    finished = Signal(str, object)
+
 class JuridocGUI(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -59,11 +66,18 @@ class JuridocGUI(QMainWindow):
 
         self.tabs.setCurrentIndex(self.sources_tab_idx)
 
+        self.save_relay = _SaveRelay(self)
+        self.save_relay.progress.connect(self._on_save_progress)
+        self.save_relay.finished.connect(self._on_save_finished)
+
         self.setCentralWidget(self.tabs)
 
         # Keep track of tabs we’ve created
         self.tab_refs = {}
 
+        Repo().sources_progress.connect(self._on_sources_progress)
+        Repo().notes_progress.connect(self._on_notes_progress)
+
     def set_sources_dir(self):
         directory = QFileDialog.getExistingDirectory(self, f"Select Sources Directory")
         if not directory:
@@ -80,9 +94,40 @@ class JuridocGUI(QMainWindow):
         Config().set('notes_dir', directory)
         self.tabs.setCurrentIndex(self.notes_tab_idx)
 
+    def _on_sources_progress(self, seen, hashed, rate):
+        if Repo().scan is not None:
+            self.statusBar().showMessage(f"Scanning sources: {seen} files, {hashed} hashed, {rate / (1024 * 1024):.1f} MB/s")
+        else:
+            self.statusBar().showMessage(f"Sources: {seen} files, {hashed} hashed", 5000)
+
+    def _on_notes_progress(self, done, total):
+        if Repo().notes_analysis is not None:
+            self.statusBar().showMessage(f"Analysing notes: {done}/{total}")
+        else:
+            self.statusBar().showMessage(f"Notes: {done} analysed", 5000)
+
     def save_db(self):
         filename, _filter = QFileDialog.getSaveFileName(self, f"Select project filename", filter="Juridoc Project (*.jd)")
-        Db().save(filename)
+        if not filename:
+            return
+
+        # Saved from the DB writer thread, the window stays responsive
+        self.save_btn.setEnabled(False)
+        self.statusBar().showMessage(f"Saving project: {filename}")
+        future = Db().save(filename, progress=self.save_relay.progress.emit)
+        future.add_done_callback(lambda f: self.save_relay.finished.emit(filename, f.exception()))
+
+    def _on_save_progress(self, copied, total):
+        if total > 0:
+            self.statusBar().showMessage(f"Saving project: {copied * 100 // total}%")
+
+    def _on_save_finished(self, filename, error):
+        self.save_btn.setEnabled(True)
+        if error is not None:
+            logger.error(f"ERROR saving project {filename}: {error}")
+            self.statusBar().showMessage(f"Project not saved: {error}")
+        else:
+            self.statusBar().showMessage(f"Project saved: {filename}", 5000)
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Q and event.modifiers() & Qt.ControlModifier:
@@ -92,23 +137,18 @@ class JuridocGUI(QMainWindow):
 
 def on_quit():
     logger.info("About to quit")
+    Repo().cancel_scan(wait=True)
+    Repo().cancel_notes_analysis(wait=True)
     Db().close()
 
 
 RETURN_BADARG=1
-RETURN_THREADSAFETY=2
 
 def run():
     logger.info("Start juridoc GUI")
     
-    # DB init
-    if not Db().is_threadsafe():
-        Db().dump_threadsafety_infos()
-
-        if not os.environ.get('IGNORE_THREADSAFETY') == '1':
-            logger.error("Dont't play with that !")
-            return RETURN_THREADSAFETY
-
+    # DB init: connections are per thread, the sqlite3 threadsafety level
+    # does not matter
     if len(sys.argv) > 1:
         db_path = sys.argv[1]
         if os.path.exists(db_path):
@@ -0,0 +1,47 @@
+from PySide6.QtCore import Qt, QRect
+from PySide6.QtGui import QColor, QPen
+from PySide6.QtWidgets import QStyle, QStyledItemDelegate, qDrawShadePanel
+
+from .sources_model import SourcesModel
+
+class SourceDelegate(QStyledItemDelegate):
+    """
+    Paints a source as its thumbnail in a raised panel, greyed out when no
+    note refers to it.
+    """
+    def __init__(self, size, parent=None):
+        super().__init__(parent)
+        self.size = size
+
+    def sizeHint(self, option, index):
+        return self.size
+
+    def paint(self, painter, option, index):
+        source = index.data(SourcesModel.SourceRole)
+        rect = QRect(option.rect.topLeft(), self.size)
+
+        painter.save()
+        painter.fillRect(rect, QColor("#eee"))
+
+        pixmap = index.data(Qt.ItemDataRole.DecorationRole)
+        if pixmap is None:
+            pixmap = index.model().fetch_thumbnail(index)
+
+        if pixmap is not None:
+            target = pixmap.size().scaled(rect.size(), Qt.AspectRatioMode.KeepAspectRatio)
+            target_rect = QRect(0, 0, target.width(), target.height())
+            target_rect.moveCenter(rect.center())
+            painter.drawPixmap(target_rect, pixmap)
+
+        if not source.xref:
+            painter.fillRect(rect, QColor(128, 128, 128, 128))
+
+        qDrawShadePanel(painter, rect, option.palette, False, 2)
+
+        if option.state & QStyle.StateFlag.State_Selected:
+            pen = QPen(option.palette.highlight().color())
+            pen.setWidth(2)
+            painter.setPen(pen)
+            painter.drawRect(rect.adjusted(1, 1, -1, -1))
+
+        painter.restore()
@@ -0,0 +1,194 @@
+import logging
+import os
+
+from PySide6.QtCore import Qt, QAbstractListModel, QByteArray, QModelIndex, QTimer
+from PySide6.QtGui import QPixmap, QPixmapCache
+
+from juridoc import Repo, Source, Thumbnails
+
+from .thumbnail_scheduler import ThumbnailScheduler
+
+logger = logging.getLogger(__name__)
+
+class SourcesModel(QAbstractListModel):
+    """
+    List of PDF sources, kept in sync with Repo signals. Thumbnails are only
+    loaded for items being painted, and kept in QPixmapCache.
+    """
+    SourceRole = Qt.ItemDataRole.UserRole + 1
+
+    def __init__(self, thumbnail_size, parent=None):
+        super().__init__(parent)
+
+        self.thumbnail_size = thumbnail_size
+        self.sources = []
+        # source id -> row, source hash -> source id, and back
+        self.rows = {}
+        self.ids = {}
+        self.hashes = {}
+        self.pending = set()
+        # Ids of sources deleted, removed from the list in one go: removing
+        # them one at a time renumbers the rows that follow each time
+        self.deleted = set()
+
+        Repo().sources_loaded.connect(self._on_sources_loaded)
+        Repo().source_added.connect(self._on_source_added)
+        Repo().source_changed.connect(self._on_source_changed)
+        Repo().source_deleted.connect(self._on_source_deleted)
+        ThumbnailScheduler().thumbnail_ready.connect(self._on_thumbnail_ready)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.sources)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        source = self.sources[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return os.path.basename(source.relpath)
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            return source.relpath
+        elif role == Qt.ItemDataRole.DecorationRole:
+            return QPixmapCache.find(self._cache_key(source.hash))
+        elif role == self.SourceRole:
+            return source
+
+        return None
+
+    def fetch_thumbnail(self, index):
+        """
+        Returns the thumbnail of a painted item, loading it from the store or
+        requesting its rendering, with the item row as priority.
+        """
+        source = self.sources[index.row()]
+        if source.hash in self.pending:
+            return None
+
+        data = Thumbnails().get(source.hash, self.thumbnail_size.width(), self.thumbnail_size.height())
+        if data:
+            pixmap = QPixmap()
+            pixmap.loadFromData(QByteArray(data), "PNG")
+            QPixmapCache.insert(self._cache_key(source.hash), pixmap)
+            return pixmap
+
+        self.pending.add(source.hash)
+        ThumbnailScheduler().request(source, self.thumbnail_size, index.row())
+
+        return None
+
+    def cancel_thumbnails(self, keep):
+        """
+        Cancel pending thumbnail requests of rows not in keep.
+        """
+        for hash in list(self.pending):
+            id = self.ids.get(hash)
+            if id is None or self.rows[id] not in keep:
+                self.pending.discard(hash)
+                if id is not None:
+                    ThumbnailScheduler().cancel(self.sources[self.rows[id]], self.thumbnail_size)
+
+    def _cache_key(self, hash):
+        return f"{hash}:{self.thumbnail_size.width()}x{self.thumbnail_size.height()}"
+
+    def _on_sources_loaded(self, sources):
+        self._remove_deleted()
+        sources = [source for source in sources if source.relpath.lower().endswith('.pdf') and source.id not in self.rows]
+        if not sources:
+            return
+
+        row = len(self.sources)
+        self.beginInsertRows(QModelIndex(), row, row + len(sources) - 1)
+        for i, source in enumerate(sources, start=row):
+            self.sources.append(source)
+            self.rows[source.id] = i
+            self.ids[source.hash] = source.id
+            self.hashes[source.id] = source.hash
+        self.endInsertRows()
+
+    def _on_source_added(self, source):
+        if not source.relpath.lower().endswith('.pdf'):
+            return
+
+        self._remove_deleted()
+        row = len(self.sources)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.sources.append(source)
+        self.rows[source.id] = row
+        self.ids[source.hash] = source.id
+        self.hashes[source.id] = source.hash
+        self.endInsertRows()
+
+    def _on_source_changed(self, source, changes):
+        self._remove_deleted()
+        row = self.rows.get(source.id)
+        if row is None:
+            self._on_source_added(source)
+            return
+
+        if not source.relpath.lower().endswith('.pdf'):
+            self._on_source_deleted(source)
+            return
+
+        if Source.HASH in changes:
+            old_hash = self.hashes.get(source.id)
+            self.ids.pop(old_hash, None)
+            self.pending.discard(old_hash)
+            self.ids[source.hash] = source.id
+            self.hashes[source.id] = source.hash
+
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def _on_source_deleted(self, source):
+        if source.id not in self.rows:
+            return
+
+        if not self.deleted:
+            QTimer.singleShot(0, self._remove_deleted)
+        self.deleted.add(source.id)
+
+    def _remove_deleted(self):
+        """
+        Remove rows of deleted sources, by runs of contiguous rows from the
+        last one, then renumber the rows that follow the first one.
+        """
+        if not self.deleted:
+            return
+
+        rows = sorted(self.rows.pop(id) for id in self.deleted)
+        self.deleted = set()
+
+        runs = []
+        for row in rows:
+            if runs and runs[-1][1] == row - 1:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
+
+        for first, last in reversed(runs):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for source in self.sources[first:last + 1]:
+                self.ids.pop(self.hashes.pop(source.id, None), None)
+                if source.hash in self.pending:
+                    self.pending.discard(source.hash)
+                    ThumbnailScheduler().cancel(source, self.thumbnail_size)
+            del self.sources[first:last + 1]
+            self.endRemoveRows()
+
+        for i in range(rows[0], len(self.sources)):
+            self.rows[self.sources[i].id] = i
+
+    def _on_thumbnail_ready(self, hash, size, pixmap):
+        if size != self.thumbnail_size:
+            return
+
+        self.pending.discard(hash)
+        QPixmapCache.insert(self._cache_key(hash), pixmap)
+
+        id = self.ids.get(hash)
+        if id is not None:
+            index = self.index(self.rows[id])
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
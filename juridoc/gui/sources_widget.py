@@ -1,68 +1,83 @@
 import logging
 import os
 
-from PySide6.QtCore import QSize
+from PySide6.QtCore import QSize, QTimer
+from PySide6.QtGui import QPixmapCache
 from PySide6.QtWidgets import (
-    QWidget, QGridLayout, QVBoxLayout, QScrollArea
+    QWidget, QVBoxLayout, QListView
 )
 
 from juridoc import Config
 from juridoc import Repo
 
-from .source_widget import SourceWidget
+from .source_delegate import SourceDelegate
+from .sources_model import SourcesModel
 
 logger = logging.getLogger(__name__)
 
 class SourcesWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
-        Repo().source_added.connect(self._on_source_added)
-        Repo().source_changed.connect(self._on_source_changed)
-        Repo().source_deleted.connect(self._on_source_deleted)
 
         self.selected_source = None
 
         logger.info("Creates sources widget")
 
         self.label_size = QSize(120, 160)
-        self.row, self.col = 0, 0
-        self.max_cols = 6
-
-        container = QWidget()
-        self.grid = QGridLayout(container)
-        self.grid.setSpacing(8)
-
-        scroll = QScrollArea()
-        scroll.setWidgetResizable(True)
-        scroll.setWidget(container)
+        self.spacing = 8
+
+        # Room for a few screens of thumbnails
+        QPixmapCache.setCacheLimit(max(QPixmapCache.cacheLimit(), 64 * 1024))
+
+        self.model = SourcesModel(self.label_size, self)
+
+        self.view = QListView()
+        self.view.setViewMode(QListView.ViewMode.IconMode)
+        self.view.setResizeMode(QListView.ResizeMode.Adjust)
+        self.view.setMovement(QListView.Movement.Static)
+        self.view.setLayoutMode(QListView.LayoutMode.Batched)
+        self.view.setUniformItemSizes(True)
+        self.view.setSpacing(self.spacing)
+        self.view.setGridSize(self.label_size + QSize(self.spacing, self.spacing))
+        self.view.setItemDelegate(SourceDelegate(self.label_size, self.view))
+        self.view.setModel(self.model)
+        self.view.clicked.connect(lambda index: self.select_source(index.data(SourcesModel.SourceRole)))
+        self.view.doubleClicked.connect(lambda index: self.open_source_tab(index.data(SourcesModel.SourceRole)))
+        self.view.verticalScrollBar().valueChanged.connect(self._schedule_visible_update)
+
+        # Coalesce scroll and resize bursts into one visibility check
+        self.visible_timer = QTimer(self)
+        self.visible_timer.setSingleShot(True)
+        self.visible_timer.setInterval(50)
+        self.visible_timer.timeout.connect(self._update_visible)
 
         layout = QVBoxLayout()
-        layout.addWidget(scroll)
+        layout.addWidget(self.view)
         self.setLayout(layout)
 
         self.setAcceptDrops(not Repo().sources_dir)
 
-    def _on_source_added(self, source):
-        if source.relpath.lower().endswith('.pdf'):
-            label = SourceWidget(source, size=self.label_size, parent=self)
-            self.grid.addWidget(label, self.row, self.col)
-            self.col += 1
-            if self.col >= self.max_cols:
-                self.col = 0
-                self.row += 1
-
-    def _on_source_changed(self, source, changes):
-        logger.info(f"Source changed: {source.id}: {changes}")
-
-    def _on_source_deleted(self, source):
-        logger.info(f"Source removed: {source.id}")
-
-    def clear_grid(self):
-        while self.grid.count():
-            item = self.grid.takeAt(0)
-            widget = item.widget()
-            if widget is not None:
-                widget.deleteLater()
+    def _schedule_visible_update(self):
+        self.visible_timer.start()
+
+    def _update_visible(self):
+        """
+        Cancel pending thumbnails of sources scrolled out of view. Visible ones
+        are requested by the delegate when painted.
+        """
+        viewport = self.view.viewport().rect()
+        keep = set()
+        for hash in self.model.pending:
+            id = self.model.ids.get(hash)
+            if id is not None:
+                row = self.model.rows[id]
+                if self.view.visualRect(self.model.index(row)).intersects(viewport):
+                    keep.add(row)
+        self.model.cancel_thumbnails(keep)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._schedule_visible_update()
 
     def dragEnterEvent(self, event):
         if not Repo().sources_dir:
@@ -0,0 +1,128 @@
+import logging
+
+from PySide6.QtCore import Qt, QObject, QSize, QByteArray, QBuffer, QIODevice, Signal
+from PySide6.QtGui import QPixmap
+
+from juridoc import Thumbnails
+
+from .style_factory import StyleFactory
+
+logger = logging.getLogger(__name__)
+
+class _Renderer():
+    """
+    A PDF document and its page renderer, reused from one request to the next.
+    """
+    def __init__(self, parent):
+        # The Qt PDF stack is loaded along with the first thumbnail
+        from PySide6.QtPdf import QPdfDocument, QPdfPageRenderer
+
+        self.doc = QPdfDocument(parent)
+        self.renderer = QPdfPageRenderer(parent)
+        self.renderer.setDocument(self.doc)
+        self.key = None
+        self.request_id = None
+
+class ThumbnailScheduler(QObject):
+    """
+    Renders first page thumbnails of PDF sources, at most max_renderers at a
+    time. Pending requests are served by ascending priority and can be
+    cancelled until rendering starts. Rendered thumbnails are stored in
+    Thumbnails.
+    """
+    _instance = None
+    _initialized = False
+
+    max_renderers = 4
+
+    thumbnail_ready = Signal(str, QSize, QPixmap)
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            super().__init__()
+            self._initialized = True
+
+            # (hash, width, height) -> (priority, filename)
+            self.pending = {}
+            self.idle = []
+            self.running = []
+
+    def request(self, source, size, priority=0):
+        key = (source.hash, size.width(), size.height())
+        if any(renderer.key == key for renderer in self.running):
+            return self
+
+        self.pending[key] = (priority, source.fullpath())
+        self._next()
+
+        return self
+
+    def cancel(self, source, size):
+        self.pending.pop((source.hash, size.width(), size.height()), None)
+        return self
+
+    def _next(self):
+        while self.pending and len(self.running) < self.max_renderers:
+            key = min(self.pending, key=lambda k: self.pending[k][0])
+            _priority, filename = self.pending.pop(key)
+
+            if self.idle:
+                renderer = self.idle.pop()
+            else:
+                renderer = _Renderer(self)
+                renderer.renderer.pageRendered.connect(
+                    lambda _page, _size, image, _options, request_id, r=renderer: self._on_page_rendered(r, image, request_id))
+
+            renderer.key = key
+            self.running.append(renderer)
+
+            if renderer.doc.load(filename) != renderer.doc.Error.None_:
+                logger.error(f"ERROR loading PDF {filename}: {renderer.doc.error()}")
+                self._done(renderer, None)
+                continue
+
+            _hash, width, height = key
+            thumbnail_size = (
+                renderer
+                .doc
+                .pagePointSize(0)
+                .scaled(QSize(width, height), Qt.AspectRatioMode.KeepAspectRatio)
+                .toSize()
+            )
+            renderer.request_id = renderer.renderer.requestPage(0, thumbnail_size)
+
+    def _on_page_rendered(self, renderer, image, request_id):
+        if renderer.request_id != request_id:
+            return
+
+        self._done(renderer, None if image.isNull() else QPixmap.fromImage(image))
+        self._next()
+
+    def _done(self, renderer, pixmap):
+        hash, width, height = renderer.key
+        size = QSize(width, height)
+
+        renderer.doc.close()
+        renderer.key = None
+        renderer.request_id = None
+        self.running.remove(renderer)
+        self.idle.append(renderer)
+
+        if pixmap is None:
+            icon_size = size.scaled(48, 48, Qt.AspectRatioMode.KeepAspectRatio)
+            self.thumbnail_ready.emit(hash, size, StyleFactory().error_icon.pixmap(icon_size))
+            return
+
+        ba = QByteArray()
+        buffer = QBuffer(ba)
+        buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+        pixmap.save(buffer, "PNG")
+        buffer.close()
+        Thumbnails().put(hash, width, height, ba.data())
+
+        self.thumbnail_ready.emit(hash, size, pixmap)
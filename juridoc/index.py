@@ -0,0 +1,813 @@
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from .db import Db
+from .events import Event
+from .export import Transfer, newer
+from .sources_index import SourcesIndex
+from .note import Note, init_render, render_deps, render_note, source_numbers
+from .notes_analysis import NotesAnalysis
+from .scanner import SourceScan
+from .source import Source
+from .thumbnails import Thumbnails
+from .utils import file_stat, path_range, row_stat
+
+logger = logging.getLogger(__name__)
+
+def _chunks(values, size=500):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def _source_stat(source):
+    return source.stat or (None, None, None, None)
+
+class Index():
+    """
+    Sources and notes of a project, indexed into the project DB. Qt-free:
+    scans run on the calling thread and events are called synchronously.
+    Watching directories is left to subclasses, through the _watch_* hooks.
+    """
+    notes_output_subdir = "notes"
+    index_filename = "index.ods"
+    sources_subdir = "sources"
+
+    # Sources known from the project, before any check of the filesystem
+    sources_loaded = Event()
+    source_added = Event()
+    source_changed = Event()
+    source_deleted = Event()
+
+    # Files seen, files hashed, bytes hashed per second
+    sources_progress = Event()
+    # Notes analysed, notes to analyse
+    notes_progress = Event()
+
+    def __init__(self):
+        self.sources_dir = None
+        self.notes_dir = None
+        self.output_dir = None
+
+        self.sources = {}
+        # Source hash -> Source, for xref resolution
+        self.hashes = {}
+
+        self.hash_workers = os.cpu_count() or 1
+        self.scan = None
+        self.analysis_workers = os.cpu_count() or 1
+        self.notes_analysis = None
+
+        # None: Transfer default
+        self.export_workers = None
+        self.export_links = False
+
+    def set_hash_workers(self, workers):
+        if workers:
+            self.hash_workers = max(1, int(workers))
+        logger.info(f"Set hash workers: {self.hash_workers}")
+        return self
+
+    def set_analysis_workers(self, workers):
+        if workers:
+            self.analysis_workers = max(1, int(workers))
+        logger.info(f"Set analysis workers: {self.analysis_workers}")
+        return self
+
+    def set_export_workers(self, workers):
+        if workers:
+            self.export_workers = max(1, int(workers))
+        logger.info(f"Set export workers: {self.export_workers or 'default'}")
+        return self
+
+    def set_export_links(self, links):
+        """
+        Export sources and plain notes as hard links instead of copies, where
+        the output dir shares their filesystem.
+        """
+        self.export_links = links in (True, '1', 'true', 'True')
+        logger.info(f"Set export links: {self.export_links}")
+        return self
+
+    def set_sources_dir(self, sources_dir):
+        if sources_dir is not None:
+            sources_dir = os.path.realpath(sources_dir)
+        logger.info(f"Set sources dir: {sources_dir}")
+
+        if sources_dir == self.sources_dir:
+            return self
+        
+        self._cancel_scan()
+
+        if sources_dir is None:
+            self._cleanup_sources_dir(self.sources_dir)
+            self.sources_dir = None
+            return self
+        
+        self.sources_dir = sources_dir
+        self._traverse_source_dir(sources_dir)
+
+        return self
+    
+    def _traverse_source_dir(self, dir):
+        normdir = os.path.normpath(dir)
+
+        known = self._load_sources(*self._location_filter(normdir))
+        self._warm_start(known)
+        self._start_scan(roots=[normdir], known=known)
+
+        return self
+
+    def _warm_start(self, rows):
+        """
+        Register sources known from the project right away, as they were last
+        seen. The scan that follows only reports differences with the
+        filesystem.
+        """
+        loaded = []
+        for row in rows:
+            if row['id'] in self.sources:
+                continue
+            source = Source(row['sources_dir'], row['path'], hash=row['hash'], xref=bool(row['xref']), id=row['id'], stat=row_stat(row))
+            self.sources[source.id] = source
+            self.hashes[source.hash] = source
+            loaded.append(source)
+
+        if loaded:
+            logger.info(f"Loaded {len(loaded)} sources from project")
+            self.sources_loaded.emit(loaded)
+
+        return self
+
+    def _diff_source_dir(self, dir):
+        """
+        Compare a snapshot of dir entries with the known sources under it.
+        Returns the new subdirectories to walk, the files added or changed with
+        their stats, and the known rows that may have gone.
+        """
+        reldir = os.path.relpath(dir, self.sources_dir)
+        prefix = '' if reldir == '.' else reldir + os.sep
+
+        sources_paths = []
+        stats = {}
+        subdirs = set()
+        with os.scandir(dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirs.add(entry.name)
+                    elif entry.is_file():
+                        stats[entry.path] = file_stat(entry.path)
+                        sources_paths.append(entry.path)
+                except OSError as e:
+                    logger.error(f"ERROR reading source {entry.path}: {e}")
+
+        # Known sources directly in dir: nested ones are only loaded for the
+        # subdirectories that disappeared
+        direct_paths, known_subdirs = self._known_entries(prefix)
+        direct = {}
+        for chunk in _chunks(direct_paths):
+            for row in self._load_sources(f"s.sources_dir = ? AND s.path IN ({', '.join('?' * len(chunk))})", (self.sources_dir, *chunk)):
+                direct[os.path.join(row['sources_dir'], row['path'])] = row
+
+        changed = [filepath for filepath in sorted(sources_paths)
+                   if filepath not in direct or row_stat(direct[filepath]) != stats[filepath]]
+        known = [row for filepath, row in direct.items() if filepath not in stats or row_stat(row) != stats[filepath]]
+
+        for subdir in known_subdirs:
+            if subdir not in subdirs:
+                known.extend(self._load_sources(*self._location_filter(os.path.join(dir, subdir))))
+
+        roots = [os.path.join(dir, subdir) for subdir in sorted(subdirs) if subdir not in known_subdirs]
+
+        return roots, changed, stats, known
+
+    def _known_entries(self, prefix):
+        """
+        Returns the relative paths of known sources directly under the
+        directory of relative path prefix ('' for the sources dir), and the
+        names of its subdirectories holding known sources. Entries are found
+        one seek on the (sources_dir, path) index at a time, skipping the
+        sources of each subdirectory found: the cost follows the entries of
+        the directory, not the sources under it.
+        """
+        conn = Db().get_conn()
+        where = 'sources_dir = ? AND path >= ?'
+        params = ()
+        if prefix:
+            where += ' AND path < ?'
+            params += (path_range(prefix[:-1])[1],)
+        lower = prefix
+
+        paths = []
+        subdirs = []
+        while True:
+            row = conn.execute(f'''
+                    SELECT path FROM source
+                    WHERE {where}
+                    ORDER BY path
+                    LIMIT 1
+                ''', (self.sources_dir, lower, *params)).fetchone()
+            if row is None:
+                return paths, subdirs
+
+            subdir, sep, _ = row['path'][len(prefix):].partition(os.sep)
+            if sep:
+                subdirs.append(subdir)
+                lower = path_range(prefix + subdir)[1]
+            else:
+                paths.append(row['path'])
+                # Smallest path following it
+                lower = row['path'] + '\0'
+
+    def _location_filter(self, dir):
+        """
+        Returns a (where, params) filter on sources located under dir, as a
+        range over the (sources_dir, path) index.
+        """
+        reldir = os.path.relpath(dir, self.sources_dir)
+        if reldir == '.':
+            return 's.sources_dir = ?', (self.sources_dir,)
+        else:
+            return 's.sources_dir = ? AND s.path >= ? AND s.path < ?', (self.sources_dir, *path_range(reldir))
+
+    def _load_sources(self, where, params):
+        """
+        Returns source rows matching where, with their stat fingerprint and
+        whether a note refers to them.
+        """
+        with Db().get_conn() as conn:
+            return conn.execute(f'''
+                    SELECT s.id AS id, s.hash AS hash, s.sources_dir AS sources_dir, s.path AS path,
+                        s.size AS size, s.mtime_ns AS mtime_ns, s.inode AS inode, s.device AS device,
+                        EXISTS (SELECT 1 FROM xref AS x WHERE x.source_hash = s.hash) AS xref
+                    FROM source AS s
+                    WHERE {where}
+                ''', params).fetchall()
+
+    def _start_scan(self, roots=(), filepaths=(), stats={}, known=()):
+        """
+        Walk and hash sources. Results are synced as they come in batches;
+        known rows left unseen are deleted once the scan is over.
+        """
+        self.scan = SourceScan(self.hash_workers, roots, filepaths, stats, known)
+        self.scan.batch_ready.connect(self._on_scan_batch)
+        self.scan.progress.connect(self._on_scan_progress)
+        self.scan.finished.connect(self._on_scan_finished)
+        self.scan.run()
+
+        return self
+
+    def cancel_scan(self, wait=False):
+        """
+        Stop the running sources scan. Batches already synced are kept.
+        """
+        scan = self.scan
+        self._cancel_scan()
+        if wait and scan is not None:
+            scan.wait()
+        return self
+
+    def _cancel_scan(self):
+        if self.scan is not None:
+            logger.info("Sources scan cancelled")
+            self.scan.cancel()
+            self.scan = None
+            self.sources_progress.emit(0, 0, 0.0)
+
+    def _on_scan_batch(self, scan, dirs, results):
+        if scan is not self.scan:
+            return
+
+        for dir in dirs:
+            self._watch_source_dir(dir)
+
+        if not results:
+            return
+
+        found = {}
+        stats = {}
+        for filepath, stat, hash in results:
+            found[filepath] = hash
+            stats[filepath] = stat
+            if hash not in self.hashes:
+                scan.new_content = True
+        scan.found.update(found)
+
+        known = [scan.by_path[filepath] for filepath in found if filepath in scan.by_path]
+        try:
+            self._sync_sources(found, stats, known, scan.seen)
+        except sqlite3.Error as e:
+            # One file must not cost the whole batch: sync them one by one
+            logger.error(f"ERROR syncing sources batch: {e}")
+            for filepath, hash in found.items():
+                row = scan.by_path.get(filepath)
+                try:
+                    self._sync_sources({filepath: hash}, {filepath: stats[filepath]}, [row] if row is not None else [], scan.seen)
+                except sqlite3.Error as e:
+                    logger.error(f"ERROR syncing source {filepath}: {e}")
+
+    def _on_scan_progress(self, scan, seen, hashed, rate):
+        if scan is self.scan:
+            self.sources_progress.emit(seen, hashed, rate)
+
+    def _on_scan_finished(self, scan):
+        if scan is not self.scan:
+            return
+        self.scan = None
+
+        if not scan.cancelled:
+            gone = [row for filepath, row in scan.by_path.items() if filepath not in scan.found and not scan.is_failed(filepath)]
+            try:
+                self._sync_sources({}, {}, gone, scan.seen)
+            except sqlite3.Error as e:
+                logger.error(f"ERROR removing sources: {e}")
+
+            logger.info(f"Sources scan done: {scan.files_seen} files, {scan.files_hashed} hashed")
+
+        self.sources_progress.emit(scan.files_seen, scan.files_hashed, 0.0)
+
+        # Notes resolved while the scan was running may refer to new content
+        if scan.new_content and self.notes_dir is not None:
+            self._analyse_notes()
+
+    def _sync_sources(self, found, stats, known, seen=None):
+        """
+        Reconcile the source table with files found on disk, in one transaction.
+
+        found are the files hashed ({filepath: hash}), stats their fingerprints.
+        known are the source rows covering them: those not found on disk
+        anymore are deleted. seen holds ids of rows already synced by earlier
+        batches of the same scan. Signals are emitted once the transaction is
+        committed.
+        """
+        conn = Db().get_conn()
+
+        if seen is None:
+            seen = set()
+        known = [row for row in known if row['id'] not in seen]
+
+        by_path = {}
+        by_hash = {}
+        for row in known:
+            by_path[os.path.join(row['sources_dir'], row['path'])] = row
+            by_hash[row['hash']] = row
+
+        # Content may come from anywhere in the sources dir (moved file)
+        missing = list(set(hash for hash in found.values() if hash not in by_hash))
+        for chunk in _chunks(missing):
+            for row in self._load_sources(f"s.hash IN ({', '.join('?' * len(chunk))})", chunk):
+                by_hash[row['hash']] = row
+
+        xref_hashes = set()
+        with conn:
+            for chunk in _chunks(list(set(found.values()))):
+                for row in conn.execute(f"SELECT DISTINCT source_hash FROM xref WHERE source_hash IN ({', '.join('?' * len(chunk))})", chunk):
+                    xref_hashes.add(row[0])
+
+        inserted = {}
+        # Row id -> hash of the file that took it in this batch
+        claimed = {}
+        updated = []
+        moved = []
+        stale = set()
+        rehashed = []
+        added = []
+        changed = []
+        # Ids seen and fields of indexed sources before this batch, restored
+        # if the transaction fails
+        seen_before = set(seen)
+        saved = {}
+
+        for filepath, hash in found.items():
+            relpath = os.path.relpath(filepath, self.sources_dir)
+            stat = stats[filepath]
+
+            row = by_hash.get(hash)
+            if row is not None and row['id'] in seen:
+                if claimed.get(row['id'], self._source_hash(row['id'], hash)) == hash:
+                    # Same content already synced from another path
+                    logger.warning(f"Duplicate source ignored: {relpath}")
+                    continue
+                # The row went to a file with other content (copied or moved,
+                # then rewritten): this one is a new source
+                row = None
+            elif row is not None:
+                rowpath = os.path.join(row['sources_dir'], row['path'])
+                if rowpath != filepath and found.get(rowpath) == hash:
+                    # Same content is still present at its known path
+                    logger.warning(f"Duplicate source ignored: {relpath}")
+                    continue
+            if row is None:
+                row = by_path.get(filepath)
+                if row is not None and row['id'] in seen:
+                    row = None
+
+            if row is None:
+                if hash in inserted:
+                    logger.warning(f"Duplicate source ignored: {relpath}")
+                    continue
+                logger.info(f"Source added: {relpath}")
+                inserted[hash] = Source(self.sources_dir, relpath, hash=hash, xref=hash in xref_hashes, stat=stat)
+                continue
+
+            id = row['id']
+            seen.add(id)
+            claimed[id] = hash
+
+            source = self.sources.get(id)
+            if source is None:
+                source = Source(row['sources_dir'], row['path'], hash=row['hash'], id=id, stat=row_stat(row))
+                source.set_xref(row['hash'] in xref_hashes)
+                added.append(source)
+            else:
+                saved[id] = (source, source.hash, source.sources_dir, source.relpath, source.xref, source.stat)
+
+            changes = []
+            old_hash = source.hash
+            if source.set_hash(hash):
+                logger.info(f"Source content changed: {relpath}")
+                changes.append(Source.HASH)
+                stale.add(old_hash)
+                rehashed.append((source, old_hash))
+
+            if source.set_path(self.sources_dir, relpath):
+                logger.info(f"Source renamed: {relpath}")
+                changes.append(Source.PATH)
+
+            if source.set_xref(hash in xref_hashes):
+                changes.append(Source.XREF)
+
+            stat_changed = source.set_stat(stat)
+            if Source.HASH in changes or Source.PATH in changes:
+                moved.append(source)
+            if stat_changed or Source.HASH in changes or Source.PATH in changes:
+                updated.append(source)
+
+            if id in self.sources and len(changes) > 0:
+                changed.append((source, changes))
+
+        deleted = [row for row in known if row['id'] not in seen]
+
+        def write(conn):
+            conn.executemany('DELETE FROM source WHERE id = ?', [(row['id'],) for row in deleted])
+
+            # Release unique hash and path of moved rows first, so that
+            # swapped files do not collide while being updated
+            conn.executemany('''
+                    UPDATE source SET hash = '~' || id, path = NULL WHERE id = ?
+                ''', [(source.id,) for source in moved])
+            conn.executemany('''
+                    UPDATE source
+                    SET hash = ?, sources_dir = ?, path = ?, size = ?, mtime_ns = ?, inode = ?, device = ?
+                    WHERE id = ?
+                ''', [(source.hash, source.sources_dir, source.relpath, *_source_stat(source), source.id) for source in updated])
+
+            conn.executemany('''
+                    INSERT INTO source (hash, sources_dir, path, size, mtime_ns, inode, device)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', [(source.hash, source.sources_dir, source.relpath, *_source_stat(source)) for source in inserted.values()])
+            for chunk in _chunks(list(inserted)):
+                for row in conn.execute(f"SELECT id, hash FROM source WHERE hash IN ({', '.join('?' * len(chunk))})", chunk):
+                    inserted[row['hash']].set_id(row['id'])
+
+            stale.update(row['hash'] for row in deleted)
+            Thumbnails().discard(stale, conn)
+
+        try:
+            Db().write(write).result()
+        except sqlite3.Error:
+            for source, hash, sources_dir, relpath, xref, stat in saved.values():
+                source.hash, source.sources_dir, source.relpath, source.xref, source.stat = hash, sources_dir, relpath, xref, stat
+            seen.intersection_update(seen_before)
+            raise
+
+        for row in deleted:
+            logger.info(f"Source removed: {row['path']}")
+            source = self.sources.pop(row['id'], None)
+            if source is not None:
+                if self.hashes.get(row['hash']) is source:
+                    del self.hashes[row['hash']]
+                self.source_deleted.emit(source)
+
+        for source, old_hash in rehashed:
+            if self.hashes.get(old_hash) is source:
+                del self.hashes[old_hash]
+        for source, _ in rehashed:
+            self.hashes[source.hash] = source
+
+        for source in added + list(inserted.values()):
+            self.sources[source.id] = source
+            self.hashes[source.hash] = source
+            self.source_added.emit(source)
+
+        for source, changes in changed:
+            self.source_changed.emit(source, changes)
+
+        return self
+
+    def _source_hash(self, id, default=None):
+        source = self.sources.get(id)
+        return source.hash if source is not None else default
+
+    def _cleanup_sources_dir(self, dir):
+        normpath = os.path.normpath(dir)
+
+        known = self._load_sources(*self._location_filter(normpath))
+        self._sync_sources({}, {}, known)
+
+        self._unwatch_source_dir(normpath)
+
+        return self
+
+    def set_notes_dir(self, notes_dir):
+        self.cancel_notes_analysis()
+        self.notes_dir = notes_dir
+        self._analyse_notes()
+        return self
+
+    def set_output_dir(self, output_dir):
+        self.output_dir = output_dir
+        os.makedirs(self.output_dir, exist_ok=True)
+        return self
+
+    def export_notes(self):
+        """
+        Export notes to output_dir: notes referring to sources are rendered,
+        the others copied like sources. Returns the Transfer of copied notes.
+        """
+        output_notes_dir = os.path.join(self.output_dir, self.notes_output_subdir)
+        os.makedirs(output_notes_dir, exist_ok=True)
+
+        conn = Db().get_conn()
+        rows = conn.execute('''
+            SELECT n.id, n.notes_dir, n.path, n.refs,
+                EXISTS (SELECT 1 FROM xref AS x WHERE x.note_id = n.id) AS xref
+            FROM notes AS n
+            ORDER BY n.path
+        ''').fetchall()
+
+        # A note copied over its former rendering must be rendered again once
+        # it refers to sources
+        copied = [row for row in rows if not row['xref']]
+        Db().write(lambda conn: conn.executemany('''
+                DELETE FROM note_export WHERE path = ?
+            ''', [(os.path.realpath(os.path.join(output_notes_dir, row['path'])),) for row in copied])).result()
+
+        transfer = Transfer(self.export_workers, self.export_links)
+        transfer.run(
+            (os.path.join(row['notes_dir'], row['path']), os.path.join(output_notes_dir, row['path']))
+            for row in copied
+        )
+        logger.info(f"Exported notes: {transfer.summary()}")
+
+        self._render_notes([row for row in rows if row['xref']], output_notes_dir, conn)
+
+        return transfer
+
+    def _render_notes(self, rows, out_dir, conn):
+        """
+        Render notes of rows into out_dir, make-style: a note is rendered again
+        only if it is newer than its output, or if the numbers of the sources
+        it refers to changed since. Rendering is CPU bound: notes are spread
+        over a process pool of analysis_workers.
+        """
+        start = time.monotonic()
+        numbers = source_numbers(conn=conn)
+        rendered = dict((row['path'], row['deps']) for row in conn.execute('SELECT path, deps FROM note_export'))
+
+        # Output path -> (note row, deps)
+        todo = {}
+        for row in rows:
+            out_path = os.path.realpath(os.path.join(out_dir, row['path']))
+            deps = render_deps((row['refs'] or '').split(), numbers)
+            if rendered.get(out_path) == deps and newer(out_path, os.path.join(row['notes_dir'], row['path'])):
+                continue
+            todo[out_path] = (row, deps)
+
+        done = []
+        for out_path, (relpath, error) in zip(todo, self._run_renders([row for row, _ in todo.values()], out_dir, numbers)):
+            if error is None:
+                done.append((out_path, todo[out_path][1]))
+            else:
+                logger.error(f"ERROR rendering note {relpath}: {error}")
+
+        Db().write(lambda conn: conn.executemany('''
+                INSERT INTO note_export (path, deps)
+                VALUES (?, ?)
+                ON CONFLICT(path) DO UPDATE SET deps=excluded.deps
+            ''', done)).result()
+
+        logger.info(f"Rendered {len(done)} notes in {time.monotonic() - start:.1f}s, {len(rows) - len(todo)} up to date" + (f", {len(todo) - len(done)} failed" if len(done) < len(todo) else ""))
+        return self
+
+    def _run_renders(self, rows, out_dir, numbers):
+        """
+        Render notes of rows, yielding (relpath, error) in input order.
+        """
+        if self.analysis_workers <= 1 or len(rows) < 2:
+            init_render(numbers)
+            try:
+                for row in rows:
+                    yield render_note(row['notes_dir'], row['path'], out_dir)
+            finally:
+                init_render({})
+            return
+
+        workers = min(self.analysis_workers, len(rows))
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_render, initargs=(numbers,))
+        try:
+            yield from pool.map(render_note, [row['notes_dir'] for row in rows], [row['path'] for row in rows], repeat(out_dir))
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def export_index(self, format=None):
+        """
+        Export the sources index, as index_filename or in another format
+        supported by SourcesIndex (csv, jsonl, ods, xlsx).
+        """
+        filename = self.index_filename
+        if format:
+            filename = f"{os.path.splitext(filename)[0]}.{format}"
+        SourcesIndex(self.sources_dir).export(os.path.join(self.output_dir, filename))
+
+    def export_sources(self):
+        """
+        Export sources to output_dir, skipping the ones already exported.
+        Returns the Transfer, with its throughput summary.
+        """
+        output_sources_dir = os.path.join(self.output_dir, self.sources_subdir)
+        os.makedirs(output_sources_dir, exist_ok=True)
+
+        # Sources of former sources dirs are kept in the project, not exported
+        conn = Db().get_conn()
+        cursor = conn.execute('''
+            SELECT sources_dir, path
+            FROM source
+            WHERE sources_dir = ?
+            ORDER BY path
+        ''', (self.sources_dir,))
+
+        transfer = Transfer(self.export_workers, self.export_links)
+        transfer.run(
+            (os.path.join(row['sources_dir'], row['path']), os.path.join(output_sources_dir, row['path']))
+            for row in cursor
+        )
+        logger.info(f"Exported sources: {transfer.summary()}")
+
+        return transfer
+
+    def cancel_notes_analysis(self, wait=False):
+        """
+        Stop the running notes analysis. Nothing of it is stored.
+        """
+        analysis = self.notes_analysis
+        if analysis is not None:
+            logger.info("Notes analysis cancelled")
+            analysis.cancel()
+            self.notes_analysis = None
+            self.notes_progress.emit(0, 0)
+            if wait:
+                analysis.wait()
+        return self
+
+    def _analyse_notes(self, dirs=None):
+        """
+        Re-analyse notes under dirs (whole notes dir by default) incrementally:
+        only new notes and notes whose stat fingerprint changed are parsed.
+        Stored references of the others are resolved again against the current
+        sources. source_changed is emitted for sources whose xref state changed.
+        A running analysis is cancelled.
+        """
+        if self.notes_dir is None:
+            return self
+
+        self.cancel_notes_analysis()
+        self._start_notes_analysis(NotesAnalysis(self.analysis_workers, self.notes_dir, dirs or [self.notes_dir]))
+
+        return self
+
+    def _start_notes_analysis(self, analysis):
+        """
+        Parse notes, results being stored once the analysis is over.
+        """
+        self.notes_analysis = analysis
+        analysis.progress.connect(self._on_notes_progress)
+        analysis.finished.connect(self._on_notes_analysed)
+        analysis.run()
+
+        return self
+
+    def _on_notes_progress(self, analysis, done, total):
+        if analysis is self.notes_analysis:
+            self.notes_progress.emit(done, total)
+
+    def _on_notes_analysed(self, analysis):
+        if analysis is not self.notes_analysis:
+            return
+        self.notes_analysis = None
+
+        if analysis.cancelled or analysis.notes_dir != self.notes_dir:
+            return
+
+        for path in analysis.paths:
+            self._watch_notes_path(path)
+
+        known = analysis.known
+        stats = analysis.stats
+
+        conn = Db().get_conn()
+        xrefs = {}
+        ids = [row['id'] for row in known.values()]
+        for chunk in _chunks(ids):
+            for row in conn.execute(f"SELECT note_id, source_hash FROM xref WHERE note_id IN ({', '.join('?' * len(chunk))})", chunk):
+                xrefs.setdefault(row['note_id'], set()).add(row['source_hash'])
+
+        modified = set(analysis.modified)
+        unchanged = []
+        for relpath, stat in stats.items():
+            if relpath not in modified:
+                row = known[relpath]
+                note = Note(self.notes_dir, relpath, id=row['id'], stat=stat)
+                unchanged.append(note.resolve(row['refs'].split(), self.hashes))
+
+        parsed = []
+        for relpath, refs, error in analysis.extracted:
+            if error:
+                logger.error(f"ERROR loading note {relpath}: {error}")
+            else:
+                logger.info(f"Loaded note: {relpath}")
+            row = known.get(relpath)
+            note = Note(self.notes_dir, relpath, id=row['id'] if row else None, stat=stats[relpath])
+            parsed.append(note.resolve(refs, self.hashes))
+
+        deleted = [row for relpath, row in known.items() if relpath not in stats]
+
+        def write(conn):
+            for row in deleted:
+                logger.info(f"Note removed: {row['path']}")
+            conn.executemany('DELETE FROM xref WHERE note_id = ?', [(row['id'],) for row in deleted])
+            conn.executemany('DELETE FROM notes WHERE id = ?', [(row['id'],) for row in deleted])
+
+            conn.executemany('''
+                    INSERT INTO notes (notes_dir, path, size, mtime_ns, inode, device, refs)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET
+                        notes_dir=excluded.notes_dir,
+                        size=excluded.size,
+                        mtime_ns=excluded.mtime_ns,
+                        inode=excluded.inode,
+                        device=excluded.device,
+                        refs=excluded.refs
+                ''', [(note.notes_dir, note.relpath, *note.stat, ' '.join(note.refs)) for note in parsed])
+
+            new = dict((note.relpath, note) for note in parsed if note.id is None)
+            for chunk in _chunks(list(new)):
+                for row in conn.execute(f"SELECT id, path FROM notes WHERE path IN ({', '.join('?' * len(chunk))})", chunk):
+                    new[row['path']].id = row['id']
+
+            # Only replace xref rows of notes whose resolved references changed
+            stale = [note for note in unchanged + parsed if set(note.xrefs) != xrefs.get(note.id, set())]
+            conn.executemany('DELETE FROM xref WHERE note_id = ?', [(note.id,) for note in stale])
+            conn.executemany('''
+                    INSERT OR IGNORE INTO xref (source_hash, note_id)
+                    VALUES (?, ?)
+                ''', [(xref, note.id) for note in stale for xref in note.xrefs])
+
+            touched = set()
+            for row in deleted:
+                touched.update(xrefs.get(row['id'], ()))
+            for note in stale:
+                touched.update(xrefs.get(note.id, ()))
+                touched.update(note.xrefs)
+
+            referenced = set()
+            for chunk in _chunks([hash for hash in touched if hash in self.hashes]):
+                for row in conn.execute(f"SELECT DISTINCT source_hash FROM xref WHERE source_hash IN ({', '.join('?' * len(chunk))})", chunk):
+                    referenced.add(row['source_hash'])
+
+            return touched, referenced
+
+        touched, referenced = Db().write(write).result()
+
+        for hash in touched:
+            source = self.hashes.get(hash)
+            if source is not None and source.set_xref(hash in referenced):
+                self.source_changed.emit(source, [Source.XREF])
+
+        self.notes_progress.emit(len(parsed), len(parsed))
+
+        return self
+
+    def _watch_source_dir(self, dir):
+        pass
+
+    def _unwatch_source_dir(self, dir):
+        pass
+
+    def _watch_notes_path(self, path):
+        pass
@@ -1,135 +1,167 @@
+import hashlib
+import json
 import logging
 import os
 import re
-import shutil
-
-import odfdo
+import zipfile
+from xml.parsers import expat
 
 from .db import Db
 
 logger = logging.getLogger(__name__)
 
+SRC_HREF = re.compile(r'^src:([0-9a-fA-F]+)$')
+
+# Expat names, with ' ' as namespace separator
+TEXT_A = 'urn:oasis:names:tc:opendocument:xmlns:text:1.0 a'
+XLINK_HREF = 'http://www.w3.org/1999/xlink href'
+
+def extract_refs(filepath):
+    """
+    Returns the source hashes referenced by 'src:<hex>' links of an ODT note.
+    """
+    refs = []
+    if filepath.endswith('.odt'):
+        try:
+            hrefs = _stream_hrefs(filepath)
+        except (zipfile.BadZipFile, KeyError, expat.ExpatError) as e:
+            logger.debug(f"Parse note {filepath} with odfdo: {e}")
+            hrefs = _odfdo_hrefs(filepath)
+
+        for href in hrefs:
+            m = SRC_HREF.match(href)
+            if m:
+                refs.append(m.group(1).lower())
+
+    return refs
+
+def _stream_hrefs(filepath):
+    """
+    Returns hrefs of text:a elements, streaming content.xml out of the ODT
+    zip without building a document tree.
+    """
+    hrefs = []
+
+    def start_element(name, attrs):
+        if name == TEXT_A:
+            href = attrs.get(XLINK_HREF)
+            if href:
+                hrefs.append(href)
+
+    parser = expat.ParserCreate(namespace_separator=' ')
+    parser.StartElementHandler = start_element
+    with zipfile.ZipFile(filepath) as odt, odt.open('content.xml') as content:
+        parser.ParseFile(content)
+
+    return hrefs
+
+def _odfdo_hrefs(filepath):
+    # odfdo is slow to import, and only needed for notes expat can't parse
+    import odfdo
+
+    doc = odfdo.Document(filepath)
+    return [href for href in (elem.get_attribute('xlink:href') for elem in doc.body.get_elements('//text:a')) if href]
+
+def source_numbers(hashes=None, conn=None):
+    """
+    Returns {source hash: source number}, of the given hashes or of all
+    sources, in one query.
+    """
+    conn = conn or Db().get_conn()
+    if hashes is None:
+        rows = conn.execute('SELECT hash, idx FROM source')
+    else:
+        rows = conn.execute('''
+            SELECT hash, idx
+            FROM source
+            WHERE hash IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(list(hashes)),))
+    return {row['hash']: row['idx'] for row in rows}
+
+def render_deps(refs, numbers):
+    """
+    Returns a digest of the numbers of the sources refs (hashes) refer to, to
+    tell whether a rendered note is out of date.
+    """
+    deps = ' '.join(f"{ref}:{numbers.get(ref, '-')}" for ref in sorted(set(refs)))
+    return hashlib.sha1(deps.encode()).hexdigest()
+
+# Hash -> number map of render_note(), set per process by init_render()
+_render_numbers = {}
+
+def init_render(numbers):
+    global _render_numbers
+    _render_numbers = numbers
+
+def render_note(notes_dir, relpath, out_dir):
+    """
+    Process pool entry point: returns (relpath, error) for a note rendered
+    with the numbers given to init_render().
+    """
+    try:
+        Note(notes_dir, relpath)._render(out_dir, _render_numbers)
+        return relpath, None
+    except Exception as e:
+        return relpath, str(e)
+
+def analyse_note(notes_dir, relpath):
+    """
+    Process pool entry point: returns (relpath, refs, error) for a note.
+    """
+    try:
+        return relpath, extract_refs(os.path.join(notes_dir, relpath)), None
+    except Exception as e:
+        return relpath, [], str(e)
+
 class Note():
-    def __init__(self, notes_dir, path, idx=None):
+    def __init__(self, notes_dir, path, idx=None, id=None, stat=None):
         # path is relative to notes_dir
+        # stat is the (size, mtime_ns, inode, device) fingerprint of the file
+        self.id = id
         self.notes_dir = notes_dir
         self.relpath = path
+        self.stat = stat
+        self.refs = []
         self.xrefs = []
         self.idx = idx
 
-    def analyse(self):
-        path = os.path.join(self.notes_dir, self.relpath)
-
-        try:
-            if path.endswith('.odt'):
-                self._lookup_odt_note(path)
-            logging.info(f"Loaded note: {self.relpath}")
-        except Exception as e:
-            logging.error(f"ERROR loading note {self.relpath}: {e}")
-
-        return self
-    
-    def process(self, out_dir):
-        with Db().get_conn() as conn:
-            ret = conn.execute('''
-                SELECT CASE WHEN xref.id IS NOT NULL THEN 1 ELSE 0 END AS xref
-                FROM xref
-                JOIN notes ON xref.note_id = notes.id
-                WHERE notes.filepath = ?
-            ''', (self.relpath,)).fetchone()
-
-            if ret and ret['xref']:
-                self._render(self, out_dir, conn)
-            else:
-                self._copy(out_dir)
-
+    def resolve(self, refs, sources):
+        """
+        Keep references to known sources as xrefs. All references are kept in
+        refs, to be resolved again when sources change.
+        """
+        self.refs = list(dict.fromkeys(refs))
+        self.xrefs = [ref for ref in self.refs if ref in sources]
         return self
     
-    def _render(self, out_dir):
+    def _render(self, out_dir, numbers=None):
         """
-        Replace xref (src:<hex>) in the document with idx from index, save to OUT/notes.
+        Replace xrefs (src:<hex>) in the document with source numbers, save to
+        OUT/notes. numbers maps source hashes to numbers, shared by the notes
+        of an export; the note's sources are looked up in one query otherwise.
         """
+        import odfdo
+
         doc = odfdo.Document(os.path.join(self.notes_dir, self.relpath))
         out_path = os.path.join(out_dir, self.relpath)
         os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        conn = Db().get_conn()
 
+        links = []
         for a in doc.body.get_elements("//text:a"):
-            href = a.get_attribute("xlink:href")
-            if href:
-                replacement = self._format_xref(href, conn)
-                a.parent.replace_element(a, odfdo.Span(replacement))
-
-        doc.save(out_path)
-        logging.info(f"Rendered note: {out_path}")
+            m = SRC_HREF.match(a.get_attribute("xlink:href") or '')
+            if m:
+                links.append((a, m.group(1).lower()))
 
-        return self
-    
-    def _copy(self, out_dir):
-        """
-        Copy note file to OUT/notes dir as is.
-        """
-        out_path = os.path.join(out_dir, self.relpath)
-        os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        shutil.copy2(os.path.join(self.notes_dir, self.relpath), out_path)
-        logging.info(f"Copied note: {out_path}")
+        if numbers is None:
+            numbers = source_numbers(set(hash for _, hash in links), Db().get_conn())
 
-        return self
+        for a, hash in links:
+            number = numbers.get(hash)
+            # Unknown sources are left as their href
+            replacement = f"{number}" if number is not None else a.get_attribute("xlink:href")
+            a.parent.replace_element(a, odfdo.Span(replacement))
 
-    def _format_xref(href, conn):
-        m = re.match(r'^src:([0-9a-fA-F]+)$', href)
-        if m:
-            hexkey = m.group(1)
-            ret = conn.execute('''
-                    SELECT source.idx
-                    FROM source
-                    WHERE source.hash = ?
-            ''', (hexkey,)).fetchone()
-            if ret:
-                return f"{ret['idx']}"
-            else:
-                return href
-    
-    def _lookup_odt_note(self, filepath):
-        doc = odfdo.Document(filepath)
-        conn = Db().get_conn()
-        sources = conn.execute('SELECT hash FROM source').fetchall()
-
-        # Find references to sources
-        for elem in doc.body.get_elements('//text:a'):
-            href = elem.get_attribute('xlink:href')
-            uri = self._find_source(href, sources)
-            if uri:
-                sources[uri].update({'xref': True})
-                self.xrefs.append(uri)
+        doc.save(out_path)
+        logging.info(f"Rendered note: {out_path}")
 
         return self
-
-    def _find_source(self, href, sources):
-        """
-        If href matches 'src:<hex>' and <hex> is a key in sources, returns <hex>, else None.
-        """
-        m = re.match(r'^src:([0-9a-fA-F]+)$', href)
-        if m:
-            hexkey = m.group(1)
-            if hexkey in sources:
-                return hexkey
-
-        return None
-    
-    def save(self, conn):
-        with conn:
-            cursor = conn.execute('''
-                INSERT OR IGNORE INTO notes (notes_dir, filepath)
-                VALUES (?, ?)
-            ''', (self.notes_dir, self.relpath))
-            note_id = cursor.lastrowid
-
-            for xref in self.xrefs:
-                conn.execute('''
-                    INSERT INTO xref (source_hash, note_id)
-                    VALUES (?, ?)
-                ''', (xref, note_id))
-            conn.commit()
-
-        return self
\ No newline at end of file
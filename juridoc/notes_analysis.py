@@ -0,0 +1,148 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from .db import Db
+from .events import Event
+from .note import analyse_note
+from .utils import file_stat, path_range, row_stat
+
+logger = logging.getLogger(__name__)
+
+class NotesAnalysis():
+    """
+    Finds notes under dirs of notes_dir, and extracts source references of the
+    new ones and of those whose stat fingerprint changed, on the calling thread
+    or a thread of its own.
+
+    run() analyses on the calling thread, start() on a thread of its own: the
+    receiver then reads results on its own thread once finished. Parsing is
+    CPU bound: notes are spread over a process pool of workers. The analysis
+    stops early once cancelled.
+    """
+    # analysis, notes parsed, notes to parse
+    progress = Event()
+    finished = Event()
+
+    # Longest delay between two progress reports, in seconds
+    report_interval = 0.5
+
+    def __init__(self, workers, notes_dir, dirs):
+        self.workers = workers
+        self.notes_dir = notes_dir
+        self.dirs = list(dirs)
+        self.cancelled = False
+
+        # Results: directories and notes to watch, {relpath: stat} of notes
+        # found, {relpath: row} of notes known under dirs, and
+        # [(relpath, refs, error)] of notes parsed
+        self.paths = []
+        self.stats = {}
+        self.known = {}
+        self.modified = []
+        self.extracted = []
+
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="notes-analysis", daemon=True)
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+        return self
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+        return self
+
+    def run(self):
+        try:
+            self._walk()
+            if not self.cancelled:
+                self._load_known()
+                self._extract()
+        except Exception as e:
+            logger.error(f"ERROR analysing notes: {e}")
+            self.cancelled = True
+        finally:
+            self.finished.emit(self)
+            if threading.current_thread() is self.thread:
+                Db().release()
+
+    def _walk(self):
+        for dir in self.dirs:
+            for dirpath, _, filenames in os.walk(dir):
+                if self.cancelled:
+                    return
+                self.paths.append(dirpath)
+
+                for filename in sorted(filenames):
+                    if filename.startswith('.~lock.'):
+                        continue
+                    filepath = os.path.join(dirpath, filename)
+                    try:
+                        self.stats[os.path.relpath(filepath, self.notes_dir)] = file_stat(filepath)
+                    except OSError as e:
+                        logger.error(f"ERROR reading note {filepath}: {e}")
+                        continue
+                    if filename.endswith('.odt'):
+                        self.paths.append(filepath)
+
+    def _load_known(self):
+        conn = Db().get_conn()
+        for dir in self.dirs:
+            reldir = os.path.relpath(dir, self.notes_dir)
+            if reldir == '.':
+                rows = conn.execute('''
+                        SELECT id, notes_dir, path, size, mtime_ns, inode, device, refs
+                        FROM notes
+                    ''')
+            else:
+                rows = conn.execute('''
+                        SELECT id, notes_dir, path, size, mtime_ns, inode, device, refs
+                        FROM notes
+                        WHERE path >= ? AND path < ?
+                    ''', path_range(reldir))
+            self.known.update((row['path'], row) for row in rows)
+
+        for relpath, stat in self.stats.items():
+            row = self.known.get(relpath)
+            if row is None or row['notes_dir'] != self.notes_dir or row_stat(row) != stat or row['refs'] is None:
+                self.modified.append(relpath)
+
+    def _extract(self):
+        reported = time.monotonic()
+        for i, result in enumerate(self._extract_notes(self.modified), start=1):
+            self.extracted.append(result)
+            if self.cancelled:
+                return
+
+            now = time.monotonic()
+            if i == len(self.modified) or now - reported >= self.report_interval:
+                reported = now
+                self.progress.emit(self, i, len(self.modified))
+
+    def _extract_notes(self, relpaths):
+        """
+        Extract source references of notes, yielding (relpath, refs, error) in
+        input order.
+        """
+        if self.workers <= 1 or len(relpaths) < 2:
+            for relpath in relpaths:
+                yield analyse_note(self.notes_dir, relpath)
+            return
+
+        workers = min(self.workers, len(relpaths))
+        chunksize = max(1, len(relpaths) // (workers * 4))
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            yield from pool.map(analyse_note, repeat(self.notes_dir), relpaths, chunksize=chunksize)
+        finally:
+            pool.shutdown(cancel_futures=True)
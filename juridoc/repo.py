@@ -1,29 +1,56 @@
 import logging
 import os
 
-from PySide6.QtCore import QObject, QFileSystemWatcher, QThreadPool, Signal
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, Signal
 
 from .config import Config
-from .db import Db
-from .sources_index import SourcesIndex
-from .note import Note
+from .index import Index
+from .scanner import SourceScan
 from .source import Source
-from .utils import file_hash
+from .watcher import DirWatcher
 
 logger = logging.getLogger(__name__)
 
-class Repo(QObject):
+class _ScanRelay(QObject):
+    """
+    Posts events of a scan running on its own thread to the main thread.
+    """
+    batch_ready = Signal(object, object, object)
+    progress = Signal(object, int, int, float)
+    finished = Signal(object)
+
+class _NotesRelay(QObject):
+    """
+    Posts events of a notes analysis running on its own thread to the main
+    thread.
+    """
+    progress = Signal(object, int, int)
+    finished = Signal(object)
+
+class Repo(QObject, Index):
+    """
+    The project Index of the GUI: scans and notes analyses run off the main
+    thread, sources and notes directories are watched, and events are Qt
+    signals.
+    """
     _instance = None
     _initialized = False
 
-    notes_output_subdir = "notes"
-    index_filename = "index.ods"
-    sources_subdir = "sources"
+    # Quiet periods before processing watcher events, in ms
+    sources_debounce = 300
+    notes_debounce = 500
 
+    # Sources known from the project, before any check of the filesystem
+    sources_loaded = Signal(list)
     source_added = Signal(Source)
     source_changed = Signal(Source, list)
     source_deleted = Signal(Source)
 
+    # Files seen, files hashed, bytes hashed per second
+    sources_progress = Signal(int, int, float)
+    # Notes analysed, notes to analyse
+    notes_progress = Signal(int, int)
+
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
@@ -34,15 +61,32 @@ class Repo(QObject):
             super().__init__()
             self._initialized = True
 
-            self.sources_dir = None
-            self.notes_dir = None
-            self.output_dir = None
-
-            self.sources = {}
-
             self.sources_watcher = None
             self.notes_watcher = None
 
+            self.scan_relay = _ScanRelay(self)
+            self.scan_relay.batch_ready.connect(self._on_scan_batch)
+            self.scan_relay.progress.connect(self._on_scan_progress)
+            self.scan_relay.finished.connect(self._on_scan_finished)
+
+            self.notes_relay = _NotesRelay(self)
+            self.notes_relay.progress.connect(self._on_notes_progress)
+            self.notes_relay.finished.connect(self._on_notes_analysed)
+
+            # Coalesce bursts of sources events (bulk copies)
+            self.sources_pending = set()
+            self.sources_timer = QTimer(self)
+            self.sources_timer.setSingleShot(True)
+            self.sources_timer.setInterval(self.sources_debounce)
+            self.sources_timer.timeout.connect(self._on_sources_timeout)
+
+            # Coalesce bursts of notes events (editors write temp files on save)
+            self.notes_pending = set()
+            self.notes_timer = QTimer(self)
+            self.notes_timer.setSingleShot(True)
+            self.notes_timer.setInterval(self.notes_debounce)
+            self.notes_timer.timeout.connect(self._on_notes_timeout)
+
     def start(self):
         Config().config_changed.connect(self._on_config_changed)
 
@@ -52,214 +96,148 @@ class Repo(QObject):
             self.set_sources_dir(value)
         elif key == 'notes_dir':
             self.set_notes_dir(value)
+        elif key == 'hash_workers':
+            self.set_hash_workers(value)
+        elif key == 'analysis_workers':
+            self.set_analysis_workers(value)
+        elif key == 'export_workers':
+            self.set_export_workers(value)
+        elif key == 'export_links':
+            self.set_export_links(value)
 
     def set_sources_dir(self, sources_dir):
-        sources_dir = os.path.realpath(sources_dir)
-        logger.info(f"Set sources dir: {sources_dir}")
-
-        if sources_dir == self.sources_dir:
-            return self
-        
-        if sources_dir is None:
-            self._cleanup_sources_dir(self.sources_dir)
-            self.sources_dir = None
-            return self
-        
-        self.sources_dir = sources_dir
-
-        if self.sources_watcher is not None:
-            self.sources_watcher.deleteLater()
-        
-        self.sources_watcher = QFileSystemWatcher(self)
-        self.sources_watcher.fileChanged.connect(self._on_source_file_changed)
-        self.sources_watcher.directoryChanged.connect(self._on_source_dir_changed)
-
-        self._traverse_source_dir(sources_dir)
+        if sources_dir is not None and os.path.realpath(sources_dir) != self.sources_dir:
+            if self.sources_watcher is not None:
+                self.sources_watcher.deleteLater()
+
+            max_watches = Config().get('max_watches')
+            self.sources_watcher = DirWatcher(int(max_watches) if max_watches else None, self)
+            self.sources_watcher.directory_changed.connect(self._on_source_dir_changed)
+            self.sources_pending.clear()
+
+        return super().set_sources_dir(sources_dir)
+
+    def _start_scan(self, roots=(), filepaths=(), stats={}, known=()):
+        """
+        Walk and hash sources on a scan thread, its events being relayed to the
+        main thread.
+        """
+        self.scan = SourceScan(self.hash_workers, roots, filepaths, stats, known)
+        self.scan.batch_ready.connect(self.scan_relay.batch_ready.emit)
+        self.scan.progress.connect(self.scan_relay.progress.emit)
+        self.scan.finished.connect(self.scan_relay.finished.emit)
+        self.scan.start()
 
         return self
-    
-    def _traverse_source_dir(self, dir):
-        sources_paths = []
-        to_delete_ids = set()
-        normdir = os.path.normpath(dir)
-
-        with Db().get_conn() as conn:
-            cur = conn.cursor()
-            ret = cur.execute('''
-                    SELECT id 
-                    FROM source
-                    WHERE (sources_dir || '/' || path) GLOB ?
-                ''', (f"{normdir}/*",)).fetchall()
-            to_delete_ids = set([row['id'] for row in ret])
-
-            for dirpath, _, filenames in os.walk(normdir):
-                self.sources_watcher.addPath(dirpath)
-                self.sources_watcher.addPaths(filenames)
-
-                for filename in sorted(filenames):
-                    filepath = os.path.join(dirpath, filename)
-                    relpath = os.path.relpath(filepath, self.sources_dir)
-                    sources_paths.append(relpath)
-                    id = self._process_source(relpath, conn)
-                    to_delete_ids.discard(id)
-
-            self._cleanup_source_db(to_delete_ids, conn)
 
+    def cancel_scan(self, wait=False):
+        super().cancel_scan(wait)
+        if self.sources_pending:
+            self.sources_timer.start()
         return self
 
-    def _cleanup_source_db(self, to_delete_ids, conn=Db().get_conn()):
-        with conn:
-            to_delete = ", ".join("?" * len(to_delete_ids))
-            sql = f"DELETE FROM source WHERE id IN ({to_delete})"
-            conn.execute(sql, list(to_delete_ids))
+    def _on_scan_finished(self, scan):
+        done = scan is self.scan and not scan.cancelled
+        super()._on_scan_finished(scan)
 
-        return self
-    
-    def _process_source(self, relpath, conn=Db().get_conn()):
-        id = None
-
-        with conn:
-            hash = file_hash(os.path.join(self.sources_dir, relpath))
-            row = conn.execute('''
-                    SELECT s.id AS id, s.hash AS hash, s.sources_dir AS sources_dir, s.path AS path, s.image AS image, CASE WHEN x.id IS NOT NULL THEN 1 ELSE 0 END AS xref
-                    FROM source AS s
-                    LEFT JOIN xref AS x ON s.hash = x.source_hash
-                    WHERE s.hash = ? OR (s.sources_dir = ? AND s.path = ?)
-                    GROUP BY s.id
-                ''', (hash, self.sources_dir, relpath)).fetchone()
-
-            source = None
-            changes = []
-
-            if row:
-                id = row['id']
-                if id in self.sources:
-                    source = self.sources[id]
-                else:
-                    source = Source(self.sources_dir, relpath, id=id)
-
-                if source.set_hash(row['hash']):
-                    logger.info(f"Source content changed: {source.relpath}")
-                    changes.append(Source.HASH)
-                else:
-                    source.set_thumbnail(row['image'])
-
-                if source.set_path(row['sources_dir'], row['path']):
-                    logger.info(f"Source renamed: {source.relpath}")
-                    changes.append(Source.PATH)
-
-                if source.set_xref(bool(row['xref'])):
-                    changes.append(Source.XREF)
-                    
-                if id in self.sources:
-                    source.save(conn)
-                    if len(changes) > 0:
-                        self.source_changed.emit(source, changes)
-                else:
-                    source.save(conn)
-                    self.sources[id] = source
-                    self.source_added.emit(source)
-            else:
-                # Not in DB
-                logger.info(f"Source added: {relpath}")
-                source = Source(self.sources_dir, relpath, hash=hash)
-                id = source.save(conn)
-                source.set_id(id)
-                self.sources[id] = source
-                self.source_added.emit(source)
-
-        return id
-    
-    def _cleanup_sources_dir(self, dir, conn=Db().get_conn()):
-        normpath = os.path.normpath(dir)
-        
-        with conn:
-            cur = conn.cursor()
-            ret = cur.execute('''
-                    SELECT path FROM source
-                    WHERE (sources_dir || '/' || path) GLOB '?/%'
-                ''', (normpath,))
-            for path in ret:
-                self._cleanup_source(os.path.relpath(path, self.sources_dir))
-
-        self.sources_watcher.removePath(normpath)
-
-    def _cleanup_source(self, relpath, conn=Db().get_conn()):
-        logger.info(f"Source removed: {relpath}")
-
-        id = None
-        with conn:
-            cur = conn.cursor()
-            cur.execute('''
-                    DELETE FROM source
-                    WHERE sources_dir = ? AND path = ?
-                    RETURNING id
-                ''', (self.sources_dir, relpath))
-            id = cur.fetchone()[0]
-
-        self.sources_watcher.removePath(os.path.join(self.sources_dir, relpath))
-
-        if id:
-            source = self.sources[id]
-            source.deleteLater()
-            self.source_deleted.emit(source)
-
-    def _on_source_file_changed(self, path):
-        if os.path.exists(path):
-            self._process_source(os.path.relpath(path, self.sources_dir))
-        else:
-            with Db().get_conn() as conn:
-                self._cleanup_source(path, conn)
+        if done:
+            watched, polled = self.sources_watcher.watch_count()
+            logger.info(f"Watching {watched} sources directories, polling {polled}")
+
+        if self.sources_pending:
+            self.sources_timer.start()
+
+    def _watch_source_dir(self, dir):
+        self.sources_watcher.add_dir(dir)
+
+    def _unwatch_source_dir(self, dir):
+        self.sources_watcher.remove_dir(dir)
 
     def _on_source_dir_changed(self, path):
-        if os.path.exists(path):
-            self._traverse_source_dir(path)
-        else:
-            self._cleanup_sources_dir(path)
+        self.sources_pending.add(os.path.normpath(path))
+        self.sources_timer.start()
+
+    def _on_sources_timeout(self):
+        if self.scan is not None:
+            # Picked up again when the running scan is over
+            return
+
+        dirs = sorted(self.sources_pending)
+        self.sources_pending.clear()
+
+        roots = []
+        filepaths = []
+        stats = {}
+        known = {}
+        for dir in dirs:
+            if self.sources_dir is None or os.path.relpath(dir, self.sources_dir).startswith(os.pardir):
+                continue
+            if os.path.isdir(dir):
+                dir_roots, dir_paths, dir_stats, dir_known = self._diff_source_dir(dir)
+                roots.extend(dir_roots)
+                filepaths.extend(dir_paths)
+                stats.update(dir_stats)
+                known.update((row['id'], row) for row in dir_known)
+            else:
+                self._cleanup_sources_dir(dir)
+
+        if roots or filepaths or known:
+            self._start_scan(roots, filepaths, stats, known.values())
 
     def set_notes_dir(self, notes_dir):
-        self.notes_dir = notes_dir
-        self._analyse_notes()
+        if self.notes_watcher is not None:
+            self.notes_watcher.deleteLater()
+
+        self.notes_watcher = QFileSystemWatcher(self)
+        self.notes_watcher.fileChanged.connect(lambda path: self._on_notes_changed(os.path.dirname(path)))
+        self.notes_watcher.directoryChanged.connect(self._on_notes_changed)
+        self.notes_pending.clear()
+
+        return super().set_notes_dir(notes_dir)
+
+    def _start_notes_analysis(self, analysis):
+        """
+        Parse notes on an analysis thread, its events being relayed to the
+        main thread.
+        """
+        self.notes_analysis = analysis
+        analysis.progress.connect(self.notes_relay.progress.emit)
+        analysis.finished.connect(self.notes_relay.finished.emit)
+        analysis.start()
+
         return self
 
-    def set_output_dir(self, output_dir):
-        self.output_dir = output_dir
-        os.makedirs(self.output_dir, exist_ok=True)
+    def cancel_notes_analysis(self, wait=False):
+        super().cancel_notes_analysis(wait)
+        if self.notes_pending:
+            self.notes_timer.start()
         return self
 
-    def export_notes(self):
-        output_notes_dir = os.path.join(self.output_dir, self.notes_output_subdir)
-        os.makedirs(output_notes_dir, exist_ok=True)
-    
-        #for note in load_notes():
-        #    note.process(output_notes_dir)
-
-    def export_index(self):
-        index = SourcesIndex().load()
-        index.export(os.path.join(self.output_dir, self.index_filename))
-
-    def export_sources(self):
-        output_sources_dir = os.path.join(self.output_dir, self.sources_subdir)
-        os.makedirs(output_sources_dir, exist_ok=True)
-
-        #for source in load_sources():
-        #    src_path = os.path.join(self.sources_dir, source.relpath)
-        #    dest_path = os.path.join(output_sources_dir, source.relpath)
-        #    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-        #    shutil.copy2(src_path, dest_path)
-        #    logging.info(f"Copied source: {source.relpath}")
-
-    def _analyse_notes(self):
-        if self.notes_dir is None:
-            return self
-        
-        with Db().get_conn() as conn:
-            conn.execute('DELETE FROM notes')
-
-            for dirpath, _, filenames in os.walk(self.notes_dir):
-                for filename in sorted(filenames):
-                    filepath = os.path.join(dirpath, filename)
-                    Note(self.notes_dir, os.path.relpath(filepath, self.notes_dir)).analyse().save(conn)
-            conn.commit()
+    def _on_notes_analysed(self, analysis):
+        super()._on_notes_analysed(analysis)
 
-        return self
+        if self.notes_pending:
+            self.notes_timer.start()
+
+    def _watch_notes_path(self, path):
+        self.notes_watcher.addPath(path)
+
+    def _on_notes_changed(self, dir):
+        self.notes_pending.add(os.path.normpath(dir))
+        self.notes_timer.start()
+
+    def _on_notes_timeout(self):
+        if self.notes_analysis is not None:
+            # Picked up again when the running analysis is over
+            return
+
+        dirs = sorted(self.notes_pending)
+        self.notes_pending.clear()
+
+        # Subdirectories are walked with their parent
+        scope = []
+        for dir in dirs:
+            if not any(dir.startswith(parent + os.sep) for parent in scope):
+                scope.append(dir)
+
+        self._analyse_notes(scope)
@@ -0,0 +1,201 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .events import Event
+from .utils import file_hash, file_stat, row_stat
+
+logger = logging.getLogger(__name__)
+
+def _row_path(row):
+    return os.path.join(row['sources_dir'], row['path'])
+
+class SourceScan():
+    """
+    Walks and hashes sources, on the calling thread or a thread of its own.
+
+    roots are walked recursively, filepaths (with their stats) are taken as
+    is. known are the source rows covering the scanned scope: files whose stat
+    fingerprint did not change keep their stored hash. Results are posted in
+    batches, with the directories walked so far. run() scans on the calling
+    thread, start() on a thread of its own: the receiver then has to apply
+    results on its own thread. The scan stops early once cancelled.
+    """
+    # scan, directories walked, [(filepath, stat, hash)]
+    batch_ready = Event()
+    # scan, files seen, files hashed, bytes hashed per second
+    progress = Event()
+    finished = Event()
+
+    batch_size = 200
+    # Longest delay between two batches or progress reports, in seconds
+    report_interval = 0.5
+
+    def __init__(self, workers, roots=(), filepaths=(), stats={}, known=()):
+        self.workers = workers
+        self.roots = list(roots)
+        self.filepaths = list(filepaths)
+        self.stats = dict(stats)
+        self.known = list(known)
+        self.cancelled = False
+
+        # Bookkeeping of the receiver, on its own thread
+        self.by_path = dict((_row_path(row), row) for row in self.known)
+        self.found = set()
+        self.seen = set()
+        self.new_content = False
+
+        self.files_seen = 0
+        self.files_hashed = 0
+        self.bytes_hashed = 0
+        self.started = None
+        self.reported = None
+        self.dirs = []
+        self.results = []
+        # Files that could not be stated or read, and directories that could
+        # not be listed (a missing root), possibly for a while only: their
+        # sources are kept
+        self.failed = set()
+        self.failed_dirs = []
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="source-scan", daemon=True)
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+        return self
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+        return self
+
+    def run(self):
+        self.started = self.reported = time.monotonic()
+        try:
+            filepaths = self._walk()
+            if not self.cancelled:
+                self._hash(filepaths)
+        except Exception as e:
+            logger.error(f"ERROR scanning sources: {e}")
+        finally:
+            if not self.cancelled:
+                self._report(flush=True)
+            self.finished.emit(self)
+
+    def _walk(self):
+        """
+        Returns the files to hash, in walk order, stating files of roots.
+        """
+        filepaths = list(dict.fromkeys(self.filepaths))
+        listed = set(filepaths)
+        self.files_seen = len(filepaths)
+
+        for root in self.roots:
+            for dirpath, _, filenames in os.walk(root, onerror=self._walk_error):
+                if self.cancelled:
+                    return filepaths
+                self.dirs.append(dirpath)
+
+                for filename in sorted(filenames):
+                    filepath = os.path.join(dirpath, filename)
+                    if filepath in listed:
+                        continue
+                    try:
+                        self.stats[filepath] = file_stat(filepath)
+                    except OSError as e:
+                        logger.error(f"ERROR reading source {filepath}: {e}")
+                        self.failed.add(filepath)
+                        continue
+                    listed.add(filepath)
+                    filepaths.append(filepath)
+                    self.files_seen += 1
+
+                self._report()
+
+        return filepaths
+
+    def _walk_error(self, e):
+        logger.error(f"ERROR listing sources {e.filename}: {e}")
+        self.failed_dirs.append(e.filename)
+
+    def is_failed(self, filepath):
+        """
+        Whether filepath could not be read by the scan, or lies under a
+        directory that could not be listed.
+        """
+        return filepath in self.failed or any(
+            os.path.commonpath([dir, filepath]) == dir for dir in self.failed_dirs
+        )
+
+    def _hash(self, filepaths):
+        hashes = {}
+        for filepath, row in self.by_path.items():
+            if self.stats.get(filepath) == row_stat(row):
+                hashes[filepath] = row['hash']
+
+        for filepath, hash in self._hash_files(filepaths, hashes):
+            if self.cancelled:
+                return
+            if hash is not None:
+                self.results.append((filepath, self.stats[filepath], hash))
+            else:
+                self.failed.add(filepath)
+            self._report()
+
+    def _hash_files(self, filepaths, hashes):
+        """
+        Hash files on a thread pool, yielding (filepath, hash) in input order.
+        Files found in hashes are not read again. At most twice the pool size
+        files are in flight at any time.
+        """
+        window = self.workers * 2
+        futures = {}
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="source-hash")
+        try:
+            submitted = 0
+            for i, filepath in enumerate(filepaths):
+                while submitted < len(filepaths) and submitted < i + window:
+                    if filepaths[submitted] not in hashes:
+                        futures[submitted] = executor.submit(self._hash_one, filepaths[submitted])
+                    submitted += 1
+
+                if filepath in hashes:
+                    yield filepath, hashes[filepath]
+                    continue
+
+                hash = futures.pop(i).result()
+                if hash is not None:
+                    self.files_hashed += 1
+                    self.bytes_hashed += self.stats[filepath][0]
+                yield filepath, hash
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _hash_one(self, filepath):
+        if self.cancelled:
+            return None
+        try:
+            return file_hash(filepath)
+        except OSError as e:
+            logger.error(f"ERROR hashing source {filepath}: {e}")
+            return None
+
+    def _report(self, flush=False):
+        now = time.monotonic()
+        if not flush and len(self.results) < self.batch_size and now - self.reported < self.report_interval:
+            return
+
+        if self.dirs or self.results:
+            self.batch_ready.emit(self, self.dirs, self.results)
+            self.dirs = []
+            self.results = []
+
+        elapsed = now - self.started
+        self.progress.emit(self, self.files_seen, self.files_hashed, self.bytes_hashed / elapsed if elapsed > 0 else 0.0)
+        self.reported = now
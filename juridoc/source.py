@@ -1,10 +1,6 @@
 import os
 import logging
 
-from PySide6.QtCore import QByteArray, QBuffer, QIODevice
-from PySide6.QtGui import QPixmap
-
-from .db import Db
 from .utils import *
 
 logger = logging.getLogger(__name__)
@@ -14,14 +10,15 @@ class Source():
     PATH = 1
     XREF = 2
 
-    def __init__(self, sources_dir, path, hash=None, xref=False, id=None):
+    def __init__(self, sources_dir, path, hash=None, xref=False, id=None, stat=None):
         # path is relative to sources_dir
+        # stat is the (size, mtime_ns, inode, device) fingerprint of the file
         self.id = id
         self.hash = hash
+        self.stat = stat
         self.sources_dir = sources_dir
         self.relpath = path
         self.xref = xref
-        self.thumbnail = None
 
     def fullpath(self):
         return os.path.join(self.sources_dir, self.relpath)
@@ -34,7 +31,6 @@ class Source():
             return False
         else:
             self.hash = hash
-            self.thumbnail = None
             return True
 
     def set_path(self, sources_dir, path):
@@ -52,42 +48,9 @@ class Source():
             self.xref = xref
             return True
 
-    def set_thumbnail(self, data):
-        if self.thumbnail == None and data == b'':
+    def set_stat(self, stat):
+        if self.stat == stat:
             return False
-        elif data == b'':
-            self.thumbnail = None
-            return True
         else:
-            ba = QByteArray(data)
-            self.thumbnail = QPixmap()
-            self.thumbnail.loadFromData(ba, "PNG")
+            self.stat = stat
             return True
-
-    def save(self, conn=Db().get_conn()):
-        if not self.hash:
-            raise ValueError("Source must be loaded before saving")
-
-        ba = QByteArray()
-        if self.thumbnail:
-            buffer = QBuffer(ba)
-            buffer.open(QIODevice.OpenModeFlag.WriteOnly)
-            self.thumbnail.save(buffer, "PNG")
-            buffer.close()
-
-        id = None
-        with conn:
-            cur = conn.cursor()
-            cur.execute('''
-                INSERT  INTO source (id, hash, sources_dir, path, image)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(id) DO UPDATE SET
-                    hash=excluded.hash,
-                    sources_dir=excluded.sources_dir,
-                    path=excluded.path,
-                    image=excluded.image
-            ''', (self.id, self.hash, self.sources_dir, self.relpath, ba.data()))
-            id = cur.lastrowid
-        
-        return id
-    
@@ -1,26 +1,125 @@
+import csv
+import io
+import json
 import os
-import pyexcel
+import zipfile
 
 from .db import Db
 
+def _escape(text):
+    # xml.sax.saxutils would pull urllib in at import
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+ODS_MIMETYPE = 'application/vnd.oasis.opendocument.spreadsheet'
+
+ODS_MANIFEST = f'''<?xml version="1.0" encoding="UTF-8"?>
+<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.2">
+ <manifest:file-entry manifest:full-path="/" manifest:version="1.2" manifest:media-type="{ODS_MIMETYPE}"/>
+ <manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>
+</manifest:manifest>
+'''
+
+ODS_CONTENT_HEAD = '''<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" office:version="1.2">
+<office:body><office:spreadsheet><table:table table:name="Sources">
+'''
+
+ODS_CONTENT_TAIL = '''</table:table></office:spreadsheet></office:body></office:document-content>
+'''
+
 class SourcesIndex():
-    headers = ['uri', 'path']
+    """
+    Index of sources: their number, URI (content hash), path and whether a
+    note refers to them. Exports stream rows from a DB cursor to the writer, one
+    row at a time.
+    """
+    headers = ['idx', 'uri', 'path', 'xref']
+    # File extension -> export method name
+    formats = {
+        '.csv': '_export_csv',
+        '.jsonl': '_export_jsonl',
+        '.ods': '_export_ods',
+        '.xlsx': '_export_sheet',
+    }
 
-    def __init__(self):
-        self.data = []
+    def __init__(self, sources_dir):
+        self.sources_dir = sources_dir
 
-    def load(self):
-        with Db().get_conn() as conn:
-            for row in conn.execute('''
-                    SELECT source.hash AS uri, source.filepath AS path, CASE WHEN xref.id IS NOT NULL THEN 1 ELSE 0 END AS xref
-                    FROM source 
-                    LEFT JOIN xref ON source.hash = xref.source_hash 
-                    GROUP BY source.id
-                    '''):
-                self.data.append(row)
+    def rows(self, conn=None):
+        """
+        Yields (idx, uri, path, xref) of sources of sources_dir, ordered by
+        path. Sources of former sources dirs are kept in the project, not
+        listed.
+        """
+        conn = conn or Db().get_conn()
+        for row in conn.execute('''
+                SELECT s.idx AS idx, s.hash AS uri, s.path AS path,
+                    EXISTS (SELECT 1 FROM xref AS x WHERE x.source_hash = s.hash) AS xref
+                FROM source AS s
+                WHERE s.sources_dir = ?
+                ORDER BY s.path
+                ''', (self.sources_dir,)):
+            yield row['idx'], row['uri'], row['path'], row['xref']
 
     def export(self, path):
-        if not os.path.exists(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
+        """
+        Write the index to path, in the format of its extension: .csv, .jsonl
+        (one JSON object per source), .ods or .xlsx.
+        """
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in self.formats:
+            raise ValueError(f"Unsupported index format: {ext}")
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        getattr(self, self.formats[ext])(path)
+        return self
+
+    def _export_csv(self, path):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.headers)
+            writer.writerows(self.rows())
+
+    def _export_jsonl(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for idx, uri, relpath, xref in self.rows():
+                f.write(json.dumps({'idx': idx, 'uri': uri, 'path': relpath, 'xref': bool(xref)}, ensure_ascii=False, separators=(',', ':')))
+                f.write('\n')
+
+    def _export_ods(self, path):
+        """
+        Write a single sheet ODS, streaming content.xml into the zip.
+        """
+        def cell(value):
+            if isinstance(value, int):
+                return f'<table:table-cell office:value-type="float" office:value="{value}"><text:p>{value}</text:p></table:table-cell>'
+            return f'<table:table-cell office:value-type="string"><text:p>{_escape(value or "")}</text:p></table:table-cell>'
+
+        def row(values):
+            return '<table:table-row>' + ''.join(cell(value) for value in values) + '</table:table-row>\n'
+
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as ods:
+            # The mimetype comes first, uncompressed
+            ods.writestr(zipfile.ZipInfo('mimetype'), ODS_MIMETYPE, zipfile.ZIP_STORED)
+            ods.writestr('META-INF/manifest.xml', ODS_MANIFEST)
+
+            with io.TextIOWrapper(ods.open('content.xml', 'w'), encoding='utf-8') as content:
+                content.write(ODS_CONTENT_HEAD)
+                content.write(row(self.headers))
+                for values in self.rows():
+                    content.write(row(values))
+                content.write(ODS_CONTENT_TAIL)
+
+    def _export_sheet(self, path):
+        # pyexcel and its plugins are slow to import: loaded on first export
+        import pyexcel
+
+        def array():
+            yield self.headers
+            for row in self.rows():
+                yield list(row)
 
-        pyexcel.save_as(array=self.data, dest_file_name=path)
+        pyexcel.isave_as(array=array(), dest_file_name=path)
+        pyexcel.free_resources()
@@ -1,28 +1,176 @@
-import pypdf
+import math
+import multiprocessing
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def split_pdf(filename, ranges):
+# Last PDF parsed by this process: (filename, stat, reader). Consecutive range
+# batches of a file landing on the same worker share its parsed pages.
+_reader = None
+
+def _get_reader(filename):
+	global _reader
+
+	# pypdf is only loaded when splitting
+	import pypdf
+
+	st = os.stat(filename)
+	stat = (st.st_size, st.st_mtime_ns)
+	if _reader is None or _reader[0] != filename or _reader[1] != stat:
+		_reader = (filename, stat, pypdf.PdfReader(filename))
+	return _reader[2]
+
+def _output_path(filename, start, end, out_dir=None):
+	base = os.path.splitext(os.path.basename(filename))[0]
+	if start == end:
+		out_name = f"{base}_{start}.pdf"
+	else:
+		out_name = f"{base}_{start}_{end}.pdf"
+	return os.path.join(out_dir or os.path.dirname(filename), out_name)
+
+def check_ranges(ranges, pages=None):
+	"""
+	Raise ValueError for the first invalid (start, end) range: empty, before
+	the first page, or past the last of pages if given.
+	"""
+	for start, end in ranges:
+		if start < 1 or end < start:
+			raise ValueError(f"Invalid range {start}-{end}")
+		if pages is not None and end > pages:
+			raise ValueError(f"Invalid range {start}-{end} for {pages} pages")
+
+def split_pdf(filename, ranges, out_dir=None, file_ranges=None):
 	"""
 	Split a PDF into multiple PDFs given a list of (start, end) page ranges (1-based, inclusive).
-	Writes each output as <filename>_<start>[_<end>].pdf in the same directory as input.
+	Writes each output as <filename>_<start>[_<end>].pdf in out_dir, the same directory as input by default.
+	Every range is checked before anything is written, and so are
+	file_ranges, all the ranges requested from the file when ranges are a
+	batch of them. Returns the paths written.
 	"""
-	reader = pypdf.PdfReader(filename)
-	base = os.path.splitext(os.path.basename(filename))[0]
-	out_dir = os.path.dirname(filename)
-	for r in ranges:
-		start, end = r
+	import pypdf
+
+	reader = _get_reader(filename)
+	check_ranges(list(ranges) + list(file_ranges or []), len(reader.pages))
+
+	outputs = []
+	for start, end in ranges:
 		writer = pypdf.PdfWriter()
 		for i in range(start - 1, end):
 			writer.add_page(reader.pages[i])
-		if start == end:
-			out_name = f"{base}_{start}.pdf"
-		else:
-			out_name = f"{base}_{start}_{end}.pdf"
-		out_path = os.path.join(out_dir, out_name)
+		out_path = _output_path(filename, start, end, out_dir)
 		with open(out_path, "wb") as f:
 			writer.write(f)
 		print(f"Wrote {out_path}", file=sys.stderr)
+		outputs.append(out_path)
+	return outputs
+
+def split_task(filename, ranges, out_dir=None, file_ranges=None):
+	"""
+	Process pool entry point: returns (filename, outputs, seconds, error) for a
+	batch of ranges of a file.
+	"""
+	start = time.perf_counter()
+	try:
+		outputs = split_pdf(filename, ranges, out_dir, file_ranges)
+		error = None
+	except Exception as e:
+		outputs = []
+		error = str(e)
+	return filename, outputs, time.perf_counter() - start, error
+
+def check_outputs(jobs, out_dir=None):
+	"""
+	Raise ValueError if ranges of different files of jobs would be written to
+	the same output, files sharing a basename in out_dir.
+	"""
+	sources = {}
+	for filename, ranges in jobs:
+		for start, end in ranges:
+			out_path = os.path.normcase(os.path.abspath(_output_path(filename, start, end, out_dir)))
+			other = sources.setdefault(out_path, filename)
+			if os.path.abspath(other) != os.path.abspath(filename):
+				raise ValueError(f"{other} and {filename} would both be split to {out_path}")
+
+def split_many(jobs, out_dir=None, workers=None):
+	"""
+	Split many PDFs, jobs being (filename, ranges) pairs. Ranges of a file are
+	spread over at most workers processes, in contiguous batches. Returns an
+	iterator of (filename, outputs, seconds, errors) as files are done, seconds
+	being the time spent on the file by all workers. Raises ValueError before
+	splitting anything if a range is invalid, or if files would be split to
+	the same outputs.
+	"""
+	for filename, ranges in jobs:
+		try:
+			check_ranges(ranges)
+		except ValueError as e:
+			raise ValueError(f"{filename}: {e}")
+	check_outputs(jobs, out_dir)
+	return _split_many(jobs, out_dir, workers or os.cpu_count() or 1)
+
+def _split_many(jobs, out_dir, workers):
+	tasks = []
+	for filename, ranges in jobs:
+		size = max(1, math.ceil(len(ranges) / workers))
+		for i in range(0, len(ranges), size):
+			tasks.append((filename, ranges[i:i + size], ranges))
+
+	remaining = {}
+	for filename, _, _ in tasks:
+		remaining[filename] = remaining.get(filename, 0) + 1
+	done = dict((filename, ([], 0.0, [])) for filename in remaining)
+
+	def collect(filename, outputs, seconds, error):
+		file_outputs, file_seconds, errors = done[filename]
+		file_outputs.extend(outputs)
+		# Batches of a file checked against all its ranges fail alike
+		if error and error not in errors:
+			errors.append(error)
+		done[filename] = (file_outputs, file_seconds + seconds, errors)
+		remaining[filename] -= 1
+		if remaining[filename] == 0:
+			return (filename, *done.pop(filename))
+		return None
+
+	if workers <= 1 or len(tasks) < 2:
+		for filename, ranges, file_ranges in tasks:
+			result = collect(*split_task(filename, ranges, out_dir, file_ranges))
+			if result:
+				yield result
+		return
+
+	pool = ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=multiprocessing.get_context('spawn'))
+	try:
+		futures = [pool.submit(split_task, filename, ranges, out_dir, file_ranges) for filename, ranges, file_ranges in tasks]
+		for future in as_completed(futures):
+			result = collect(*future.result())
+			if result:
+				yield result
+	finally:
+		pool.shutdown(cancel_futures=True)
+
+def read_manifest(path):
+	"""
+	Read a split manifest: one '<pdf file> <ranges>' line per file, ranges as
+	accepted by parse_ranges. Blank lines and lines starting with '#' are
+	ignored. Relative paths are relative to the manifest directory.
+	Returns (filename, ranges) pairs.
+	"""
+	jobs = []
+	base_dir = os.path.dirname(os.path.abspath(path))
+	with open(path, encoding='utf-8') as f:
+		for lineno, line in enumerate(f, start=1):
+			line = line.strip()
+			if not line or line.startswith('#'):
+				continue
+			try:
+				filename, ranges_str = line.rsplit(None, 1)
+				ranges = parse_ranges(ranges_str)
+			except ValueError:
+				raise ValueError(f"{path}:{lineno}: expected '<pdf file> <ranges>'")
+			jobs.append((os.path.join(base_dir, filename), ranges))
+	return jobs
 
 def parse_ranges(ranges_str):
 	"""
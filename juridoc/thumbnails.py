@@ -0,0 +1,50 @@
+import logging
+
+from .db import Db
+
+logger = logging.getLogger(__name__)
+
+class Thumbnails():
+    """
+    Content-addressed thumbnail store: PNG images keyed by source hash and size.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(Thumbnails, cls).__new__(cls)
+        return cls._instance
+
+    def get(self, hash, width, height):
+        with Db().get_conn() as conn:
+            ret = conn.execute('''
+                    SELECT image FROM thumbnail
+                    WHERE hash = ? AND width = ? AND height = ?
+                ''', (hash, width, height)).fetchone()
+
+        return ret['image'] if ret else None
+
+    def put(self, hash, width, height, data):
+        """
+        Queue storing a thumbnail, without waiting for the write.
+        """
+        Db().write(lambda conn: conn.execute('''
+                INSERT INTO thumbnail (hash, width, height, image)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(hash, width, height) DO UPDATE SET
+                    image=excluded.image
+            ''', (hash, width, height, data)))
+
+        return self
+
+    def discard(self, hashes, conn):
+        """
+        Delete thumbnails of hashes no source refers to anymore, from a DB
+        write.
+        """
+        conn.executemany('''
+                DELETE FROM thumbnail
+                WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM source WHERE source.hash = thumbnail.hash)
+            ''', [(hash,) for hash in hashes])
+
+        return self
@@ -1,4 +1,5 @@
 import hashlib
+import os
 
 def file_hash(filepath):
 	hasher = hashlib.sha256()
@@ -6,3 +7,27 @@ def file_hash(filepath):
 		for chunk in iter(lambda: f.read(8192), b''):
 			hasher.update(chunk)
 	return hasher.hexdigest()
+
+
+def file_stat(filepath):
+	"""
+	Returns the (size, mtime_ns, inode, device) fingerprint of a file.
+	"""
+	st = os.stat(filepath)
+	return (st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)
+
+
+def row_stat(row):
+	"""
+	Returns the stat fingerprint stored in a source or notes row.
+	"""
+	return (row['size'], row['mtime_ns'], row['inode'], row['device'])
+
+
+def path_range(reldir):
+	"""
+	Returns the (lower, upper) bounds of relative paths under reldir, for a
+	range scan over an index on path: the upper bound replaces the trailing
+	separator with the character following it.
+	"""
+	return (reldir + os.sep, reldir + chr(ord(os.sep) + 1))
@@ -0,0 +1,118 @@
+import logging
+import os
+
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, Signal
+
+logger = logging.getLogger(__name__)
+
+def _snapshot(dir):
+    """
+    Returns {name: (size, mtime_ns, inode)} for the entries of dir, or None if
+    dir is gone.
+    """
+    snapshot = {}
+    try:
+        with os.scandir(dir) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                snapshot[entry.name] = (st.st_size, st.st_mtime_ns, st.st_ino)
+    except OSError:
+        return None
+
+    return snapshot
+
+class DirWatcher(QObject):
+    """
+    Watches directories, never individual files. Directories get a native
+    watch while the system grants them; beyond that limit (or max_watches),
+    they are polled every poll_interval ms by comparing stat snapshots of
+    their entries.
+
+    directory_changed is emitted with the directory path: mapping it to the
+    files that changed is left to the receiver.
+    """
+    directory_changed = Signal(str)
+
+    poll_interval = 10000
+
+    def __init__(self, max_watches=None, parent=None):
+        super().__init__(parent)
+
+        self.max_watches = max_watches
+        self.watched = set()
+        self.polled = {}
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._on_directory_changed)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(self.poll_interval)
+        self.poll_timer.timeout.connect(self._poll)
+
+    def add_dir(self, dir):
+        if dir in self.watched or dir in self.polled:
+            return self
+
+        if self.max_watches is None or len(self.watched) < self.max_watches:
+            if self.watcher.addPath(dir):
+                self.watched.add(dir)
+                return self
+
+            if os.path.isdir(dir):
+                # The system refused a new native watch
+                self.max_watches = len(self.watched)
+
+        if not self.polled:
+            logger.warning(f"Watch limit reached at {len(self.watched)} directories, polling the others")
+        self.polled[dir] = _snapshot(dir)
+        self.poll_timer.start()
+
+        return self
+
+    def remove_dir(self, dir):
+        """
+        Stop watching dir and its subdirectories.
+        """
+        prefix = dir + os.sep
+
+        removed = [path for path in self.watched if path == dir or path.startswith(prefix)]
+        if removed:
+            self.watcher.removePaths(removed)
+            self.watched.difference_update(removed)
+
+        for path in [path for path in self.polled if path == dir or path.startswith(prefix)]:
+            del self.polled[path]
+        if not self.polled:
+            self.poll_timer.stop()
+
+        return self
+
+    def watch_count(self):
+        """
+        Returns the number of (native watches, polled directories) in use.
+        """
+        return len(self.watched), len(self.polled)
+
+    def _on_directory_changed(self, dir):
+        if not os.path.isdir(dir):
+            # Native watches are dropped with their directory
+            self.watched.discard(dir)
+        self.directory_changed.emit(dir)
+
+    def _poll(self):
+        for dir, snapshot in list(self.polled.items()):
+            current = _snapshot(dir)
+            if current == snapshot:
+                continue
+
+            if current is None:
+                del self.polled[dir]
+            else:
+                self.polled[dir] = current
+            self.directory_changed.emit(dir)
+
+        if not self.polled:
+            self.poll_timer.stop()
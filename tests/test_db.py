@@ -0,0 +1,26 @@
+import threading
+
+import pytest
+
+from juridoc import Db
+
+@pytest.fixture(params=['memory', 'file'])
+def project(request, tmp_path):
+    Db().init(':memory:' if request.param == 'memory' else str(tmp_path / "project.jd"))
+    Db().write(lambda conn: conn.executemany('INSERT INTO config (key, value) VALUES (?, ?)',
+        [(f"key{i}", 'x' * 1000) for i in range(2000)])).result()
+    yield tmp_path
+    Db().close()
+
+def test_write_during_save(project):
+    stepped = threading.Event()
+    save = Db().save(str(project / "saved.jd"), pages=1, progress=lambda copied, total: stepped.set())
+
+    stepped.wait()
+    Db().write(lambda conn: conn.execute("INSERT INTO config (key, value) VALUES ('during', 'save')")).result()
+    assert not save.done()
+
+    save.result()
+    Db().close()
+    Db().init(str(project / "saved.jd"))
+    assert Db().get_conn().execute("SELECT value FROM config WHERE key = 'during'").fetchone()['value'] == 'save'
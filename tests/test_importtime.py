@@ -0,0 +1,23 @@
+import importlib.util
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location('importtime', os.path.join(ROOT, 'tools', 'importtime.py'))
+importtime = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(importtime)
+
+@pytest.mark.parametrize('entry_point', list(importtime.ENTRY_POINTS))
+def test_lazy_imports(entry_point, monkeypatch):
+    if entry_point.startswith('juridoc.gui'):
+        pytest.importorskip('PySide6')
+    # Entry points are imported from the source tree
+    monkeypatch.chdir(ROOT)
+
+    _, modules = importtime.measure(entry_point, 1)
+
+    loaded = set(module for module, _, _, _ in modules)
+    for lazy in importtime.ENTRY_POINTS[entry_point]:
+        assert not any(module == lazy or module.startswith(lazy + '.') for module in loaded), f"{lazy} is loaded at import"
@@ -0,0 +1,138 @@
+import os
+import shutil
+
+import pytest
+
+from juridoc import Db, Index, SourcesIndex
+
+@pytest.fixture
+def project(tmp_path):
+    Db().init(str(tmp_path / "project.jd"))
+    yield tmp_path
+    Db().close()
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def indexed(sources_dir):
+    """
+    Returns {path: hash} of sources stored in the project, after a full scan
+    of sources_dir by a new Index.
+    """
+    index = Index().set_hash_workers(1)
+    index.set_sources_dir(str(sources_dir))
+    rows = Db().get_conn().execute('SELECT path, hash FROM source')
+    return dict((row['path'], row['hash']) for row in rows)
+
+def test_copy_then_change(project):
+    sources = project / "sources"
+    sources.mkdir()
+    write(sources / "A.pdf", b"old")
+    before = indexed(sources)
+
+    shutil.copy(sources / "A.pdf", sources / "B.pdf")
+    write(sources / "A.pdf", b"new")
+    after = indexed(sources)
+
+    assert sorted(after) == ["A.pdf", "B.pdf"]
+    assert after["B.pdf"] == before["A.pdf"]
+    assert after["A.pdf"] != before["A.pdf"]
+
+def test_move_then_rewrite(project):
+    sources = project / "sources"
+    sources.mkdir()
+    write(sources / "A.pdf", b"old")
+    before = indexed(sources)
+
+    os.rename(sources / "A.pdf", sources / "B.pdf")
+    write(sources / "A.pdf", b"new")
+    after = indexed(sources)
+
+    assert sorted(after) == ["A.pdf", "B.pdf"]
+    assert after["B.pdf"] == before["A.pdf"]
+
+def test_copy_is_duplicate(project):
+    sources = project / "sources"
+    sources.mkdir()
+    write(sources / "A.pdf", b"same")
+    indexed(sources)
+
+    shutil.copy(sources / "A.pdf", sources / "B.pdf")
+
+    assert sorted(indexed(sources)) == ["A.pdf"]
+
+def test_switch_sources_dir(project):
+    s1 = project / "s1"
+    s2 = project / "s2"
+    s1.mkdir()
+    s2.mkdir()
+    write(s1 / "f0.pdf", b"one")
+    write(s2 / "f0.pdf", b"two")
+    write(s2 / "only2.pdf", b"only")
+    indexed(s1)
+    indexed(s2)
+
+    rows = Db().get_conn().execute('SELECT path FROM source WHERE sources_dir = ?', (str(s2),))
+    assert sorted(row['path'] for row in rows) == ["f0.pdf", "only2.pdf"]
+
+def test_numbers_not_reused(project):
+    sources = project / "sources"
+    sources.mkdir()
+    write(sources / "A.pdf", b"a")
+    write(sources / "B.pdf", b"b")
+    indexed(sources)
+
+    os.remove(sources / "B.pdf")
+    indexed(sources)
+    write(sources / "C.pdf", b"c")
+    indexed(sources)
+
+    rows = Db().get_conn().execute('SELECT path, idx FROM source')
+    assert dict((row['path'], row['idx']) for row in rows) == {"A.pdf": 1, "C.pdf": 3}
+
+def test_missing_sources_dir_kept(project):
+    sources = project / "sources"
+    sources.mkdir()
+    write(sources / "A.pdf", b"a")
+    write(sources / "B.pdf", b"b")
+    indexed(sources)
+
+    os.rename(sources, project / "unmounted")
+    assert sorted(indexed(sources)) == ["A.pdf", "B.pdf"]
+
+    os.rename(project / "unmounted", sources)
+    indexed(sources)
+    rows = Db().get_conn().execute('SELECT path, idx FROM source')
+    assert dict((row['path'], row['idx']) for row in rows) == {"A.pdf": 1, "B.pdf": 2}
+
+def test_export_current_sources_dir(project):
+    s1 = project / "s1"
+    s2 = project / "s2"
+    s1.mkdir()
+    s2.mkdir()
+    write(s1 / "f0.pdf", b"one")
+    write(s2 / "f0.pdf", b"two")
+    indexed(s1)
+
+    index = Index().set_hash_workers(1).set_export_workers(1)
+    index.set_sources_dir(str(s2))
+    index.set_output_dir(str(project / "out"))
+    transfer = index.export_sources()
+
+    assert transfer.files + transfer.skipped == 1
+    assert sorted(os.listdir(project / "out" / "sources")) == ["f0.pdf"]
+    assert (project / "out" / "sources" / "f0.pdf").read_bytes() == b"two"
+
+def test_index_current_sources_dir(project):
+    s1 = project / "s1"
+    s2 = project / "s2"
+    s1.mkdir()
+    s2.mkdir()
+    write(s1 / "f0.pdf", b"one")
+    write(s2 / "f0.pdf", b"two")
+    indexed(s1)
+    indexed(s2)
+
+    rows = list(SourcesIndex(os.path.realpath(s2)).rows())
+    assert [(idx, path) for idx, _, path, _ in rows] == [(2, "f0.pdf")]
@@ -0,0 +1,14 @@
+from juridoc import Db
+from juridoc.notes_analysis import NotesAnalysis
+
+def test_thread_connection_released(tmp_path):
+    Db().init(str(tmp_path / "project.jd"))
+    try:
+        notes = tmp_path / "notes"
+        (notes / "sub").mkdir(parents=True)
+        before = len(Db().conns)
+        for _ in range(5):
+            NotesAnalysis(1, str(notes), [str(notes / "sub")]).start().wait()
+        assert len(Db().conns) == before
+    finally:
+        Db().close()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark of juridoc entry points, from python -X importtime.
+
+Each entry point is imported in a fresh interpreter. The check fails when an
+entry point loads a module that should only load on first use, or when it
+takes longer than --budget milliseconds.
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+# Entry point -> modules it must not load at import
+ENTRY_POINTS = {
+    'juridoc': ['PySide6', 'odfdo', 'pyexcel', 'pypdf'],
+    'juridoc.cli': ['PySide6', 'odfdo', 'pyexcel', 'pypdf'],
+    'juridoc.gui.__main__': ['PySide6.QtPdf', 'odfdo', 'pyexcel', 'pypdf'],
+}
+
+# import time: self [us] | cumulative | imported package
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+def importtime(code):
+    """
+    Returns [(module, self us, cumulative us, depth)] imported running code.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if m:
+            modules.append((m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2))
+    return modules
+
+def measure(entry_point, runs):
+    """
+    Returns the best total import time of entry_point (us), and the modules it
+    loaded during that run, interpreter start-up excluded.
+    """
+    startup = set(module for module, _, _, _ in importtime('pass'))
+
+    best = None
+    for _ in range(runs):
+        modules = [m for m in importtime(f'import {entry_point}') if m[0] not in startup]
+        total = sum(cumulative for _, _, cumulative, depth in modules if depth == 0)
+        if best is None or total < best[0]:
+            best = (total, modules)
+
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('entry_points', nargs='*', default=list(ENTRY_POINTS), help="modules to import")
+    parser.add_argument('--runs', type=int, default=5, help="imports per entry point, the best one is kept")
+    parser.add_argument('--budget', type=float, help="maximum import time per entry point, in ms")
+    parser.add_argument('--top', type=int, default=5, help="heaviest modules listed per entry point")
+    args = parser.parse_args()
+
+    failed = False
+    for entry_point in args.entry_points:
+        try:
+            total, modules = measure(entry_point, args.runs)
+        except RuntimeError as e:
+            print(f"{entry_point}: import failed: {e}")
+            failed = True
+            continue
+
+        print(f"{entry_point}: {total / 1000:.1f} ms, {len(modules)} modules")
+        for module, own, _, _ in sorted(modules, key=lambda m: m[1], reverse=True)[:args.top]:
+            print(f"    {own / 1000:8.1f} ms  {module}")
+
+        loaded = set(module for module, _, _, _ in modules)
+        for lazy in ENTRY_POINTS.get(entry_point, []):
+            if any(module == lazy or module.startswith(lazy + '.') for module in loaded):
+                print(f"    FAIL: {lazy} is loaded at import")
+                failed = True
+
+        if args.budget is not None and total / 1000 > args.budget:
+            print(f"    FAIL: over budget ({args.budget:.0f} ms)")
+            failed = True
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())